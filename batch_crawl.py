@@ -0,0 +1,140 @@
+from __future__ import annotations
+from typing import List, Dict, Any
+import argparse
+import time
+from crawl_rate_controller import CrawlRateController
+from driver_metrics import DriverMetrics
+from http_fetcher import HttpFetcher
+from product_index import ProductIndex
+from product_info_listener import ProductInfoListener
+from result_sink import ResultSink, create_sink
+from shopee_crawler import ShopeeCrawler, create_driver_pool
+
+# many keywords in one process: the browser pools, http session, rate controller and product index outlive every keyword,
+# so each keyword after the first starts on warm sessions and skips products an earlier keyword already scraped
+
+
+class KeywordSink(ResultSink):
+    # tags the rows of one keyword and hands them to the batch sink, closing it only flushes this keyword
+    def __init__(self, sink: ResultSink, keyword: str) -> None:
+        super().__init__(sink.file_name, flush_size= 1)
+        self.sink = sink
+        self.keyword = keyword
+
+    def _write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.sink.write({**row, "keyword": self.keyword})
+
+
+def read_keywords(file_name: str) -> List[str]:
+    # one keyword per line, blank lines and lines starting with # are skipped, repeated keywords are crawled once
+    with open(file_name, "r", encoding= "utf-8") as file:
+        keywords = [line.strip() for line in file]
+    return list(dict.fromkeys(keyword for keyword in keywords if keyword and not keyword.startswith("#")))
+
+
+def crawl_keywords(
+    keywords: List[str],
+    output_file_name: str,
+    number_of_pages: int | None = None,
+    number_of_workers: int = 1,
+    number_of_search_workers: int = 1,
+    fetch_engine: str = "browser",
+    browser_profile: str = "default",
+    base_url: str = ProductInfoListener.SHOPEE_URL,
+    max_requests_per_second: float = 5.0,
+    seen_products_file: str | None = None,
+    flush_size: int = 100,
+    max_pages_per_browser: int = 200,
+    max_browser_memory_mb: float | None = None,
+    metrics: DriverMetrics | None = None,
+    metrics_file: str | None = None,
+    **crawler_kwargs: Any
+) -> Dict[str, Any]:
+    number_of_workers = max(1, number_of_workers)
+    # the pools are built here, so their browsers get the recycling limits and the metrics every crawler reports on
+    metrics = DriverMetrics() if metrics is None and metrics_file is not None else metrics
+    rate_controller = CrawlRateController(number_of_workers, max_requests_per_second= max_requests_per_second)
+    fetcher = HttpFetcher(pool_size= number_of_workers + number_of_search_workers) if fetch_engine == "http" else None
+    product_index = ProductIndex() if seen_products_file is None else ProductIndex.load(seen_products_file)
+    # nothing is launched here, a pool opens its first browser when a keyword actually needs one
+    driver_pool = create_driver_pool(number_of_workers, browser_profile, base_url, metrics, max_pages_per_browser, max_browser_memory_mb)
+    search_driver_pool = create_driver_pool(
+        number_of_search_workers, browser_profile, base_url, metrics, max_pages_per_browser, max_browser_memory_mb, is_warmed_up= False
+    )
+
+    number_of_rows_by_keyword: Dict[str, int] = {}
+    start = time.perf_counter()
+    sink = create_sink(output_file_name, flush_size)
+    try:
+        for keyword_num, keyword in enumerate(keywords, start= 1):
+            print(f"[Batch] {keyword_num}/{len(keywords)} {keyword}")
+            crawler = ShopeeCrawler(
+                keyword,
+                number_of_pages,
+                number_of_workers= number_of_workers,
+                fetch_engine= fetch_engine,
+                number_of_search_workers= number_of_search_workers,
+                browser_profile= browser_profile,
+                base_url= base_url,
+                rate_controller= rate_controller,
+                seen_products_file= seen_products_file,
+                flush_size= flush_size,
+                driver_pool= driver_pool,
+                search_driver_pool= search_driver_pool,
+                product_index= product_index,
+                fetcher= fetcher,
+                metrics= metrics,
+                metrics_file= metrics_file,
+                **crawler_kwargs
+            )
+            number_of_rows_by_keyword[keyword] = crawler.collect_info_into_sink(KeywordSink(sink, keyword))
+    finally:
+        sink.close()
+        driver_pool.close()
+        search_driver_pool.close()
+        if fetcher is not None:
+            fetcher.close()
+
+    return {
+        "number_of_keywords": len(keywords),
+        "number_of_rows": sink.number_of_rows_written,
+        "number_of_rows_by_keyword": number_of_rows_by_keyword,
+        "elapsed_n_seconds": round(time.perf_counter() - start, 3),
+        "driver_pool": repr(driver_pool),
+        "rate_controller": rate_controller.get_report()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Crawl every keyword of a file in one process, sharing browsers and dedup state.")
+    parser.add_argument("keyword_file", help= "one keyword per line, # starts a comment line")
+    parser.add_argument("output", help= "output for all keywords, .csv, .jsonl, .parquet or .feather, with a keyword column")
+    parser.add_argument("--pages", type= int, help= "search pages per keyword, all of them by default")
+    parser.add_argument("--workers", type= int, default= 1, help= "concurrent product pages")
+    parser.add_argument("--search-workers", type= int, default= 1, help= "concurrent search pages")
+    parser.add_argument("--fetch-engine", default= "browser", choices= list(ShopeeCrawler.FETCH_ENGINES))
+    parser.add_argument("--browser-profile", default= "default")
+    parser.add_argument("--base-url", default= ProductInfoListener.SHOPEE_URL)
+    parser.add_argument("--max-requests-per-second", type= float, default= 5.0)
+    parser.add_argument("--seen-products", help= "product index file, products in it are skipped and new ones are added")
+    parser.add_argument("--snapshot-file", help= "incremental mode, only new, changed or expired products are opened")
+    parser.add_argument("--archive-dir", help= "keep every page source for replay_archive.py")
+    parser.add_argument("--flush-size", type= int, default= 100)
+    args = parser.parse_args()
+
+    print(crawl_keywords(
+        read_keywords(args.keyword_file),
+        args.output,
+        args.pages,
+        args.workers,
+        args.search_workers,
+        args.fetch_engine,
+        args.browser_profile,
+        args.base_url,
+        args.max_requests_per_second,
+        args.seen_products,
+        args.flush_size,
+        snapshot_file= args.snapshot_file,
+        archive_dir= args.archive_dir
+    ))
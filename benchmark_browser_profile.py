@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import List, Dict, Any
+import argparse
+import time
+from driver import Driver, PROFILE_PREFERENCES
+from product_info_listener import ProductInfoListener
+
+# resource timing hides the sizes of cross-origin entries served without Timing-Allow-Origin, which is most of a
+# shopee page (images and scripts come from cdns), so only same-origin bytes are summed and cross-origin entries are
+# counted, with the bytes of the few that do expose their size. a same-origin transferSize of 0 is a cache hit.
+RESOURCE_TRAFFIC_SCRIPT = """
+const traffic = {
+    same_origin_bytes: 0, number_of_same_origin_requests: 0, number_of_same_origin_cache_hits: 0,
+    cross_origin_visible_bytes: 0, number_of_cross_origin_requests: 0, number_of_cross_origin_hidden_sizes: 0
+};
+const entries = performance.getEntriesByType("navigation").concat(performance.getEntriesByType("resource"));
+for (const entry of entries) {
+    if (new URL(entry.name, location.href).origin === location.origin) {
+        traffic.number_of_same_origin_requests += 1;
+        if (entry.transferSize === 0) {
+            traffic.number_of_same_origin_cache_hits += 1;
+            continue;
+        }
+        traffic.same_origin_bytes += entry.encodedBodySize;
+        continue;
+    }
+    traffic.number_of_cross_origin_requests += 1;
+    if (entry.encodedBodySize === 0) {
+        traffic.number_of_cross_origin_hidden_sizes += 1;
+        continue;
+    }
+    traffic.cross_origin_visible_bytes += entry.encodedBodySize;
+}
+return traffic;
+"""
+
+
+def benchmark_profile(profile: str, product_urls: List[str], is_headless: bool) -> Dict[str, Any]:
+    listener = ProductInfoListener(Driver(is_headless= is_headless, profile= profile))
+    listener.open_browser()
+    page_ready_n_seconds = []
+    page_traffic = []
+    try:
+        for url in product_urls:
+            start = time.perf_counter()
+            listener.go_to_product_url(url)
+            listener.wait_until_product_page_ready()
+            page_ready_n_seconds.append(time.perf_counter() - start)
+            page_traffic.append(listener.driver.execute_script_and_get_result(RESOURCE_TRAFFIC_SCRIPT))
+    finally:
+        listener.close()
+
+    # per page averages; the cross-origin request count is the comparable measure for cdn assets the lean profile blocks
+    report = {
+        "profile": profile,
+        "number_of_pages": len(product_urls),
+        "average_page_ready_n_seconds": round(sum(page_ready_n_seconds) / len(product_urls), 3),
+        "number_of_timeouts": listener.driver.get_wait_report()["number_of_timeouts"]
+    }
+    for name in page_traffic[0]:
+        total = sum(traffic[name] for traffic in page_traffic)
+        if name.endswith("_bytes"):
+            report[f"average_{name[:-len('_bytes')]}_kilobytes"] = round(total / len(product_urls) / 1024, 1)
+        else:
+            report[f"average_{name}"] = round(total / len(product_urls), 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Compare page-ready time and requests and bytes per page between browser profiles.")
+    parser.add_argument("product_urls", nargs= "+")
+    parser.add_argument("--profiles", nargs= "+", default= list(PROFILE_PREFERENCES), choices= list(PROFILE_PREFERENCES))
+    parser.add_argument("--headless", action= "store_true")
+    args = parser.parse_args()
+    for profile in args.profiles:
+        print(benchmark_profile(profile, args.product_urls, args.headless))
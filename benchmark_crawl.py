@@ -0,0 +1,173 @@
+from __future__ import annotations
+from typing import List, Dict, Any, Callable
+from threading import Lock
+import argparse
+import json
+import os
+import tempfile
+import time
+from selenium.webdriver.remote.webdriver import WebDriver
+from driver_metrics import DriverMetrics
+from fixture_site import FixtureSite
+from product_address_crawler import ProductAddressCrawler
+from result_sink import JsonlSink
+from shopee_crawler import ShopeeCrawler
+
+
+class CommandCounter:
+    # counts every WebDriver command of every session, each one is an http round trip to geckodriver
+    def __init__(self) -> None:
+        self.number_of_commands = 0
+        self.lock = Lock()
+        self.original_execute = WebDriver.execute
+
+    def __enter__(self) -> CommandCounter:
+        counter = self
+        original_execute = self.original_execute
+
+        def execute(web_driver: WebDriver, *args, **kwargs) -> Any:
+            with counter.lock:
+                counter.number_of_commands += 1
+            return original_execute(web_driver, *args, **kwargs)
+
+        WebDriver.execute = execute
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        WebDriver.execute = self.original_execute
+
+
+class StageTimer:
+    # times one method per pipeline stage for the duration of a run, including the pagination worker copies
+    def __init__(self, stages: Dict[str, tuple]) -> None:
+        self.stages = stages
+        self.original_methods: Dict[str, Callable] = {}
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in stages}
+        self.lock = Lock()
+
+    def _wrap(self, stage: str, method: Callable) -> Callable:
+        timer = self
+
+        def timed_method(*args, **kwargs) -> Any:
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with timer.lock:
+                    timer.latencies[stage].append(time.perf_counter() - start)
+
+        return timed_method
+
+    def __enter__(self) -> StageTimer:
+        for stage, (owner, method_name) in self.stages.items():
+            self.original_methods[stage] = getattr(owner, method_name)
+            setattr(owner, method_name, self._wrap(stage, self.original_methods[stage]))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        for stage, (owner, method_name) in self.stages.items():
+            setattr(owner, method_name, self.original_methods[stage])
+
+    def summarize(self) -> Dict[str, Dict[str, float]]:
+        summary = {}
+        for stage, latencies in self.latencies.items():
+            if len(latencies) == 0:
+                continue
+            latencies = sorted(latencies)
+            summary[stage] = {
+                "count": len(latencies),
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                "max_ms": round(latencies[-1] * 1000, 1)
+            }
+        return summary
+
+
+def run_benchmark(
+    fetch_engine: str, 
+    number_of_workers: int, 
+    number_of_pages: int, 
+    products_per_page: int, 
+    render_delay_n_seconds: float, 
+    response_delay_n_seconds: float,
+    browser_profile: str = "default",
+    max_requests_per_second: float = 1000,
+    blocked_above_requests_per_second: float | None = None
+) -> Dict[str, Any]:
+    site = FixtureSite(
+        number_of_pages= number_of_pages,
+        products_per_page= products_per_page,
+        render_delay_n_seconds= render_delay_n_seconds,
+        response_delay_n_seconds= response_delay_n_seconds,
+        # the http engine only works on server-rendered pages, the browser gets the client-rendered ones
+        is_server_rendered= fetch_engine == "http",
+        blocked_above_requests_per_second= blocked_above_requests_per_second
+    )
+    stages = {
+        "search": (ProductAddressCrawler, "_get_product_tiles"),
+        "product_http": (ShopeeCrawler, "_fetch_product_info"),
+        "product_browser": (ShopeeCrawler, "_scrape_product_url_in_browser")
+    }
+    metrics = DriverMetrics()
+    with site, CommandCounter() as command_counter, StageTimer(stages) as stage_timer, tempfile.TemporaryDirectory() as output_dir:
+        crawler = ShopeeCrawler(
+            "fixture", 
+            number_of_pages, 
+            number_of_workers, 
+            fetch_engine= fetch_engine, 
+            number_of_search_workers= number_of_workers,
+            browser_profile= browser_profile,
+            base_url= site.base_url,
+            metrics= metrics,
+            max_requests_per_second= max_requests_per_second
+        )
+        start = time.perf_counter()
+        number_of_products = crawler.collect_info_into_sink(JsonlSink(os.path.join(output_dir, "products.jsonl")))
+        elapsed_n_seconds = time.perf_counter() - start
+
+    number_of_pages_visited = site.number_of_requests["search"] + site.number_of_requests["product"]
+    return {
+        "fetch_engine": fetch_engine,
+        "number_of_workers": number_of_workers,
+        "number_of_products": number_of_products,
+        "expected_number_of_products": number_of_pages * products_per_page,
+        "elapsed_n_seconds": round(elapsed_n_seconds, 3),
+        "products_per_minute": round(number_of_products / elapsed_n_seconds * 60, 1),
+        "webdriver_commands": command_counter.number_of_commands,
+        "webdriver_commands_per_page": round(command_counter.number_of_commands / max(1, number_of_pages_visited), 2),
+        "requests": dict(site.number_of_requests),
+        "stage_latency": stage_timer.summarize(),
+        "driver_time_by_stage": metrics.summarize(),
+        "scroll": crawler.get_scroll_report(),
+        "rate_controller": crawler.get_rate_report()
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Crawl an offline fixture site and report throughput per backend and concurrency.")
+    parser.add_argument("--engines", nargs= "+", default= list(ShopeeCrawler.FETCH_ENGINES), choices= list(ShopeeCrawler.FETCH_ENGINES))
+    parser.add_argument("--workers", nargs= "+", type= int, default= [1, 4])
+    parser.add_argument("--pages", type= int, default= 3)
+    parser.add_argument("--products-per-page", type= int, default= 60)
+    parser.add_argument("--render-delay", type= float, default= 0.5, help= "seconds before client-rendered content appears")
+    parser.add_argument("--response-delay", type= float, default= 0.0, help= "seconds the server waits before every response")
+    parser.add_argument("--browser-profile", default= "default")
+    parser.add_argument("--max-requests-per-second", type= float, default= 1000, help= "upper limit of the crawler's rate controller")
+    parser.add_argument("--blocked-above", type= float, help= "the fixture redirects to its verification page above this many requests per second")
+    parser.add_argument("--output", help= "write the results as json to this file")
+    args = parser.parse_args()
+
+    results = []
+    for fetch_engine in args.engines:
+        for number_of_workers in args.workers:
+            result = run_benchmark(
+                fetch_engine, number_of_workers, args.pages, args.products_per_page, 
+                args.render_delay, args.response_delay, args.browser_profile,
+                args.max_requests_per_second, args.blocked_above
+            )
+            print(json.dumps(result, ensure_ascii= False))
+            results.append(result)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding= "utf-8") as file:
+            json.dump(results, file, ensure_ascii= False, indent= 2)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import List, Dict, Callable, Any
+import argparse
+import time
+from product_info_listener import ProductInfoListener
+
+
+class RoundTripCounter:
+    # every WebDriver command goes through WebDriver.execute, one HTTP round trip each
+    def __init__(self, listener: ProductInfoListener) -> None:
+        self.web_driver = listener.driver.driver
+        self.original_execute = self.web_driver.execute
+        self.number_of_round_trips = 0
+        self.web_driver.execute = self._execute
+
+    def _execute(self, *args, **kwargs) -> Any:
+        self.number_of_round_trips += 1
+        return self.original_execute(*args, **kwargs)
+
+    def reset(self) -> None:
+        self.number_of_round_trips = 0
+
+    def detach(self) -> None:
+        self.web_driver.execute = self.original_execute
+
+
+def _measure(listener: ProductInfoListener, counter: RoundTripCounter, is_batch_extraction: bool) -> Dict[str, Any]:
+    listener.is_batch_extraction = is_batch_extraction
+    counter.reset()
+    start = time.perf_counter()
+    info_dict = listener._get_product_info_dict()
+    return {
+        "info_dict": info_dict,
+        "round_trips": counter.number_of_round_trips,
+        "milliseconds": (time.perf_counter() - start) * 1000
+    }
+
+
+def benchmark(product_urls: List[str]) -> List[Dict[str, Any]]:
+    listener = ProductInfoListener()
+    listener.open_browser()
+    counter = RoundTripCounter(listener)
+    results = []
+    try:
+        for url in product_urls:
+            listener.go_to_product_url(url)
+            listener.wait_until_product_page_ready()
+            one_by_one = _measure(listener, counter, is_batch_extraction= False)
+            batch = _measure(listener, counter, is_batch_extraction= True)
+            results.append({
+                "url": url,
+                "one_by_one_round_trips": one_by_one["round_trips"],
+                "one_by_one_milliseconds": round(one_by_one["milliseconds"], 1),
+                "batch_round_trips": batch["round_trips"],
+                "batch_milliseconds": round(batch["milliseconds"], 1),
+                "is_same_output": one_by_one["info_dict"] == batch["info_dict"]
+            })
+    finally:
+        counter.detach()
+        listener.close()
+    return results
+
+
+def _print_results(results: List[Dict[str, Any]]) -> None:
+    for result in results:
+        print(result)
+    if len(results) == 0:
+        return
+    average: Callable[[str], float] = lambda key: sum(result[key] for result in results) / len(results)
+    print(
+        f"one by one: {average('one_by_one_round_trips'):.1f} round trips, {average('one_by_one_milliseconds'):.1f} ms per page | "
+        f"batch: {average('batch_round_trips'):.1f} round trips, {average('batch_milliseconds'):.1f} ms per page | "
+        f"same output on {sum(result['is_same_output'] for result in results)}/{len(results)} pages"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Compare one-by-one and batched product field extraction.")
+    parser.add_argument("product_urls", nargs= "+")
+    _print_results(benchmark(parser.parse_args().product_urls))
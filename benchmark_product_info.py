@@ -0,0 +1,84 @@
+from __future__ import annotations
+from typing import List, Dict, Callable, Any
+import argparse
+import gc
+import time
+import tracemalloc
+import pandas as pd
+from fixture_site import FixtureSite
+from http_fetcher import parse_product_info_dict
+from product_info import ProductInfo, get_product_key, to_product_frame
+
+
+class DictProductInfo:
+    # the record as it was before the slots: a wrapper object holding the scraped dict
+    def __init__(self, info_dict: Dict[str, Any]) -> None:
+        self.info_dict = info_dict
+        self.key = get_product_key(info_dict.get("product_url")) or info_dict["product_name"]
+
+
+def generate_info_dicts(number_of_products: int, is_normalized: bool) -> List[Dict[str, Any]]:
+    # real parser output over fixture pages, so values have the types and sizes of a crawl
+    site = FixtureSite()
+    info_dicts = []
+    try:
+        for item_id in range(1, number_of_products + 1):
+            shop_id = 1000 + item_id % 17
+            page_source = site._render_page("product", site._render_product(shop_id, item_id))
+            info_dicts.append(parse_product_info_dict(page_source, f"{site.base_url}fixture-product-{item_id}-i.{shop_id}.{item_id}", is_normalized))
+    finally:
+        site.stop()
+    return info_dicts
+
+
+def measure_bytes_per_product(create_record: Callable[[Dict[str, Any]], Any], info_dicts: List[Dict[str, Any]]) -> float:
+    # only what the records add on top of the scraped values, which both layouts share
+    gc.collect()
+    tracemalloc.start()
+    records = [create_record(info_dict) for info_dict in info_dicts]
+    memory_usage_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return memory_usage_bytes / len(info_dicts)
+
+
+def measure_best_n_seconds(callback: Callable[[], Any], number_of_repeats: int) -> float:
+    best_n_seconds = float("inf")
+    for _ in range(number_of_repeats):
+        start = time.perf_counter()
+        callback()
+        best_n_seconds = min(best_n_seconds, time.perf_counter() - start)
+    return best_n_seconds
+
+
+def benchmark(number_of_products: int, number_of_repeats: int, is_normalized: bool) -> Dict[str, Any]:
+    info_dicts = generate_info_dicts(number_of_products, is_normalized)
+    # the old record kept the dict it was given, every row its own copy
+    dict_bytes_per_product = measure_bytes_per_product(lambda info_dict: DictProductInfo(dict(info_dict)), info_dicts)
+    slots_bytes_per_product = measure_bytes_per_product(ProductInfo, info_dicts)
+
+    dict_records = [DictProductInfo(dict(info_dict)) for info_dict in info_dicts]
+    slots_records = [ProductInfo(info_dict) for info_dict in info_dicts]
+    dict_frame_n_seconds = measure_best_n_seconds(lambda: pd.DataFrame([record.info_dict for record in dict_records]), number_of_repeats)
+    slots_frame_n_seconds = measure_best_n_seconds(lambda: to_product_frame(slots_records), number_of_repeats)
+    assert pd.DataFrame([record.info_dict for record in dict_records]).equals(to_product_frame(slots_records))
+
+    return {
+        "number_of_products": number_of_products,
+        "is_normalized": is_normalized,
+        "dict_bytes_per_product": round(dict_bytes_per_product, 1),
+        "slots_bytes_per_product": round(slots_bytes_per_product, 1),
+        "memory_reduction": round(1 - slots_bytes_per_product / dict_bytes_per_product, 3),
+        "dict_frame_ms": round(dict_frame_n_seconds * 1000, 2),
+        "slots_frame_ms": round(slots_frame_n_seconds * 1000, 2),
+        "frame_speedup": round(dict_frame_n_seconds / slots_frame_n_seconds, 2)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Compare memory per product and DataFrame construction between dict and slots records.")
+    parser.add_argument("--products", type= int, default= 20000)
+    parser.add_argument("--repeats", type= int, default= 10)
+    parser.add_argument("--raw", action= "store_true", help= "keep the scraped texts instead of parsed numbers")
+    args = parser.parse_args()
+    print(benchmark(args.products, args.repeats, not args.raw))
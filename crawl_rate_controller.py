@@ -0,0 +1,171 @@
+from __future__ import annotations
+from typing import List, Dict, Any
+from contextlib import contextmanager
+from threading import Condition
+from urllib.parse import urlparse
+import re
+import time
+
+# shopee answers a crawl that is too fast with https://shopee.tw/verify/traffic?... or https://shopee.tw/buyer/login?next=...
+BLOCKED_PATH_PATTERN = re.compile(r"^/(verify|buyer/login|login)(/|$)")
+
+
+def is_blocked_url(url: str) -> bool:
+    return BLOCKED_PATH_PATTERN.search(urlparse(url).path) is not None
+
+
+class CrawlBlockedError(Exception):
+    # raised when a request lands on the verification or login page instead of the one asked for
+    def __init__(self, url: str) -> None:
+        super().__init__(f"Redirected to {url}")
+        self.url = url
+
+
+class DomainRate:
+    def __init__(self, requests_per_second: float) -> None:
+        self.requests_per_second = requests_per_second
+        self.next_request_at = 0.0
+        self.number_of_successes = 0
+        self.last_decrease_at = 0.0
+
+
+class CrawlRateController:
+    # AIMD, like tcp congestion control: every window of clean responses adds a worker and a bit of rate,
+    # a verification or login redirect, or a response slower than slow_response_n_seconds, halves both.
+    def __init__(
+        self,
+        max_concurrency: int = 1,
+        initial_concurrency: int | None = None,
+        min_concurrency: int = 1,
+        max_requests_per_second: float = 5.0,
+        initial_requests_per_second: float | None = None,
+        min_requests_per_second: float = 0.2,
+        additive_increase_per_second: float = 0.5,
+        decrease_factor: float = 0.5,
+        slow_response_n_seconds: float = 10.0,
+        blocked_penalty_n_seconds: float = 5.0
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency = self.max_concurrency if initial_concurrency is None else max(self.min_concurrency, min(initial_concurrency, self.max_concurrency))
+        self.max_requests_per_second = max_requests_per_second
+        self.min_requests_per_second = min(min_requests_per_second, max_requests_per_second)
+        self.initial_requests_per_second = max_requests_per_second if initial_requests_per_second is None else initial_requests_per_second
+        self.additive_increase_per_second = additive_increase_per_second
+        self.decrease_factor = decrease_factor
+        self.slow_response_n_seconds = slow_response_n_seconds
+        # after a block the domain gets no request at all for a while, whatever its rate
+        self.blocked_penalty_n_seconds = blocked_penalty_n_seconds
+
+        self.domain_rates: Dict[str, DomainRate] = {}
+        self.number_of_requests_in_flight = 0
+        self.condition = Condition()
+        self.decisions: List[Dict[str, Any]] = []
+
+    def _get_domain_rate(self, domain: str) -> DomainRate:
+        if domain not in self.domain_rates:
+            self.domain_rates[domain] = DomainRate(self.initial_requests_per_second)
+        return self.domain_rates[domain]
+
+    def _log_decision(self, domain: str, action: str, reason: str) -> None:
+        domain_rate = self.domain_rates[domain]
+        decision = {
+            "at": time.time(),
+            "domain": domain,
+            "action": action,
+            "reason": reason,
+            "concurrency": self.concurrency,
+            "requests_per_second": round(domain_rate.requests_per_second, 3)
+        }
+        self.decisions.append(decision)
+        print(f"[RateController] {action} on {domain} ({reason}): {self.concurrency} workers, {decision['requests_per_second']} requests/s")
+
+    def acquire(self, url: str) -> float:
+        # blocks until a worker slot is free and the domain's pacing allows the next request, returns when it was let through
+        domain = urlparse(url).netloc
+        with self.condition:
+            while (True):
+                domain_rate = self._get_domain_rate(domain)
+                if self.number_of_requests_in_flight >= self.concurrency:
+                    self.condition.wait()
+                    continue
+                wait_n_seconds = domain_rate.next_request_at - time.monotonic()
+                if wait_n_seconds > 0:
+                    self.condition.wait(wait_n_seconds)
+                    continue
+                started_at = time.monotonic()
+                domain_rate.next_request_at = started_at + 1 / domain_rate.requests_per_second
+                self.number_of_requests_in_flight += 1
+                return started_at
+
+    def release(self, url: str, started_at: float, is_blocked: bool = False, is_failed: bool = False) -> None:
+        # a request that failed for another reason says nothing about congestion, it only frees its slot
+        domain = urlparse(url).netloc
+        elapsed_n_seconds = time.monotonic() - started_at
+        with self.condition:
+            self.number_of_requests_in_flight -= 1
+            if is_failed:
+                pass
+            elif is_blocked:
+                self._decrease(domain, started_at, "blocked", self.blocked_penalty_n_seconds)
+            elif elapsed_n_seconds > self.slow_response_n_seconds:
+                self._decrease(domain, started_at, f"slow response {elapsed_n_seconds:.1f}s", 0)
+            else:
+                self._increase(domain)
+            self.condition.notify_all()
+
+    def _increase(self, domain: str) -> None:
+        domain_rate = self._get_domain_rate(domain)
+        domain_rate.number_of_successes += 1
+        # one step per window of clean responses, a window being as many requests as there are workers
+        if domain_rate.number_of_successes < self.concurrency:
+            return
+        number_of_clean_responses = domain_rate.number_of_successes
+        domain_rate.number_of_successes = 0
+        if self.concurrency >= self.max_concurrency and domain_rate.requests_per_second >= self.max_requests_per_second:
+            return
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+        domain_rate.requests_per_second = min(self.max_requests_per_second, domain_rate.requests_per_second + self.additive_increase_per_second)
+        self._log_decision(domain, "increase", f"{number_of_clean_responses} clean responses")
+
+    def _decrease(self, domain: str, started_at: float, reason: str, penalty_n_seconds: float) -> None:
+        domain_rate = self._get_domain_rate(domain)
+        domain_rate.number_of_successes = 0
+        now = time.monotonic()
+        domain_rate.next_request_at = max(domain_rate.next_request_at, now + penalty_n_seconds)
+        # requests sent before the last decrease went out at the old rate, their signals were already acted on
+        if started_at < domain_rate.last_decrease_at:
+            return
+        domain_rate.last_decrease_at = now
+        self.concurrency = max(self.min_concurrency, int(self.concurrency * self.decrease_factor))
+        domain_rate.requests_per_second = max(self.min_requests_per_second, domain_rate.requests_per_second * self.decrease_factor)
+        self._log_decision(domain, "decrease", reason)
+
+    @contextmanager
+    def request(self, url: str):
+        # a CrawlBlockedError from the body is recorded as congestion and raised again, so the caller can retry the url later
+        started_at = self.acquire(url)
+        is_blocked = False
+        is_failed = False
+        try:
+            yield self
+        except CrawlBlockedError:
+            is_blocked = True
+            raise
+        except Exception:
+            is_failed = True
+            raise
+        finally:
+            self.release(url, started_at, is_blocked, is_failed)
+
+    def get_report(self) -> Dict[str, Any]:
+        with self.condition:
+            return {
+                "concurrency": self.concurrency,
+                "requests_per_second": {domain: round(domain_rate.requests_per_second, 3) for domain, domain_rate in self.domain_rates.items()},
+                "number_of_increases": sum(1 for decision in self.decisions if decision["action"] == "increase"),
+                "number_of_decreases": sum(1 for decision in self.decisions if decision["action"] == "decrease")
+            }
+
+    def __repr__(self) -> str:
+        return f"CrawlRateController at {self.concurrency}/{self.max_concurrency} workers over {len(self.domain_rates)} domains"
@@ -0,0 +1,214 @@
+from __future__ import annotations
+from typing import List, Dict, Iterator, Any
+from multiprocessing import Process
+import argparse
+import os
+import socket
+import time
+import uuid
+from product_address_crawler import ProductAddressCrawler
+from product_info import ProductInfo, get_product_key
+from product_info_listener import ProductInfoListener
+from result_sink import create_sink
+from shopee_crawler import ShopeeCrawler
+from thread import StreamingExecutor
+from work_queue import SqliteWorkQueue, Task
+
+# coordinator/worker crawling over a shared SqliteWorkQueue: the coordinator queues keywords, workers turn a keyword
+# into product tasks and product tasks into results, and the coordinator merges the results into one output.
+KEYWORD_QUEUE = "keywords"
+PRODUCT_QUEUE = "products"
+
+
+def queue_keywords(work_queue: SqliteWorkQueue, keywords: List[str], number_of_pages: int | None = None) -> int:
+    return work_queue.put(KEYWORD_QUEUE, ((keyword, {"keyword": keyword, "number_of_pages": number_of_pages}) for keyword in keywords))
+
+
+def export_results(work_queue: SqliteWorkQueue, output_file_name: str) -> int:
+    # results are keyed by product, so a product scraped by two workers after a lease ran out is written once
+    with create_sink(output_file_name, flush_size= 1000) as sink:
+        for row in work_queue.iter_results():
+            sink.write(row)
+    return sink.number_of_rows_written
+
+
+class QueueWorker:
+    POLL_N_SECONDS = 2
+
+    def __init__(
+        self,
+        work_queue: SqliteWorkQueue,
+        number_of_workers: int = 1,
+        fetch_engine: str = "browser",
+        browser_profile: str = "default",
+        base_url: str = ProductInfoListener.SHOPEE_URL,
+        max_requests_per_second: float = 5.0,
+        is_waiting_for_work: bool = False
+    ) -> None:
+        self.work_queue = work_queue
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.number_of_workers = max(1, number_of_workers)
+        self.browser_profile = browser_profile
+        self.base_url = base_url
+        # keeps polling an empty queue instead of exiting, for workers started before the coordinator
+        self.is_waiting_for_work = is_waiting_for_work
+        # one crawler for the whole process, its http session, browser pool and rate controller outlive every task
+        self.crawler = ShopeeCrawler(
+            "",
+            number_of_workers= self.number_of_workers,
+            fetch_engine= fetch_engine,
+            browser_profile= browser_profile,
+            base_url= base_url,
+            max_requests_per_second= max_requests_per_second
+        )
+        self.number_of_products_scraped = 0
+        self.number_of_keywords_collected = 0
+
+    def _collect_keyword(self, task: Task) -> None:
+        address_scraper = ProductAddressCrawler(
+            task.payload["keyword"],
+            task.payload.get("number_of_pages"),
+            self.crawler.fetcher,
+            browser_profile= self.browser_profile,
+            base_url= self.base_url,
+            rate_controller= self.crawler.rate_controller
+        )
+        number_of_products_queued = 0
+        for current_page_tiles in address_scraper.iter_product_tiles():
+            number_of_products_queued += self.work_queue.put(
+                PRODUCT_QUEUE, ((get_product_key(url), {"url": url, "keyword": task.payload["keyword"]}) for url, _ in current_page_tiles)
+            )
+            # a keyword can take minutes, every page keeps its lease alive
+            self.work_queue.extend_lease(task, self.worker_id)
+        self.work_queue.ack(task, self.worker_id)
+        self.number_of_keywords_collected += 1
+        print(f"[{self.worker_id}] {task.key}: queued {number_of_products_queued} new products")
+
+    def _scrape_product_task(self, task: Task) -> ProductInfo | None:
+        # the lease started at the claim, renewed here so the scrape gets all of it whatever the wait for a slot.
+        # a lease lost meanwhile belongs to another worker, which reports the task
+        if not self.work_queue.extend_lease(task, self.worker_id):
+            return
+        return self.crawler.scrape_product_url(task.payload["url"])
+
+    def _iter_product_tasks(self) -> Iterator[Dict[str, Task]]:
+        # claims one task at a time, but the executor reads up to number_of_workers + 1 tasks ahead of its busy workers,
+        # so a claimed task can wait for a slot, see _scrape_product_task
+        while (True):
+            tasks = self.work_queue.claim(PRODUCT_QUEUE, self.worker_id)
+            if len(tasks) == 0:
+                return
+            yield {"task": tasks[0]}
+
+    def _scrape_product_tasks(self) -> int:
+        executor = StreamingExecutor(self._scrape_product_task, self.number_of_workers, timeout_n_seconds= self.work_queue.lease_n_seconds)
+        number_of_tasks_finished = 0
+        for task_result in executor.stream(self._iter_product_tasks()):
+            task: Task = task_result.kwargs["task"]
+            number_of_tasks_finished += 1
+            if not task_result.is_success:
+                print(f"[{self.worker_id}] Failed {task.payload['url']}: {task_result.error}")
+                self.work_queue.nack(task, self.worker_id, repr(task_result.error))
+                continue
+            product_info = task_result.result
+            if product_info is None:
+                self.work_queue.ack(task, self.worker_id)
+                continue
+            row = {**product_info.info_dict, "keyword": task.payload["keyword"]}
+            if self.work_queue.ack(task, self.worker_id, product_info.key, row):
+                self.number_of_products_scraped += 1
+        return number_of_tasks_finished
+
+    def _run_once(self) -> bool:
+        # products first, so search pages are only crawled when every known product is taken
+        if self._scrape_product_tasks() > 0:
+            return True
+        keyword_tasks = self.work_queue.claim(KEYWORD_QUEUE, self.worker_id)
+        if len(keyword_tasks) == 0:
+            return False
+        try:
+            self._collect_keyword(keyword_tasks[0])
+        except Exception as error:
+            print(f"[{self.worker_id}] Failed keyword {keyword_tasks[0].key}: {error}")
+            self.work_queue.nack(keyword_tasks[0], self.worker_id, repr(error))
+        return True
+
+    def run(self) -> None:
+        try:
+            while (True):
+                if self._run_once():
+                    continue
+                # other workers still hold leases: they may queue more products, or their leases may run out
+                if self.work_queue.is_drained() and not self.is_waiting_for_work:
+                    break
+                time.sleep(self.POLL_N_SECONDS)
+        finally:
+            self.crawler.close()
+            print(f"[{self.worker_id}] Done, {self.number_of_keywords_collected} keywords and {self.number_of_products_scraped} products")
+
+
+def run_worker(queue_file_name: str, lease_n_seconds: float, is_shared_across_hosts: bool, worker_kwargs: Dict[str, Any]) -> None:
+    # module level so multiprocessing can start it, every process opens its own connection
+    QueueWorker(SqliteWorkQueue(queue_file_name, lease_n_seconds, is_shared_across_hosts= is_shared_across_hosts), **worker_kwargs).run()
+
+
+def run_coordinator(work_queue: SqliteWorkQueue, output_file_name: str, poll_n_seconds: float = 10) -> int:
+    while not work_queue.is_drained():
+        print(f"[Coordinator] {work_queue.get_counts()}, {work_queue.get_number_of_results()} results")
+        time.sleep(poll_n_seconds)
+    print(f"[Coordinator] {work_queue.get_counts()}")
+    return export_results(work_queue, output_file_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Crawl keywords with any number of worker processes sharing one work queue.")
+    parser.add_argument("queue_file", help= "sqlite file shared by the coordinator and every worker")
+    parser.add_argument("--lease", type= float, default= 300, help= "seconds a claimed task stays with its worker")
+    parser.add_argument("--shared-across-hosts", action= "store_true", help= "the queue file is on a network filesystem used by several machines, every process must pass it")
+    subparsers = parser.add_subparsers(dest= "command", required= True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help= "queue keywords, wait until they are crawled and merge the results")
+    coordinator_parser.add_argument("output", help= "merged output, .csv, .jsonl, .parquet or .feather")
+    coordinator_parser.add_argument("--keywords", nargs= "*", default= [])
+    coordinator_parser.add_argument("--keyword-file", help= "one keyword per line")
+    coordinator_parser.add_argument("--pages", type= int, help= "search pages per keyword, all of them by default")
+    coordinator_parser.add_argument("--poll", type= float, default= 10)
+
+    worker_parser = subparsers.add_parser("worker", help= "claim and run tasks until the queue is drained")
+    worker_parser.add_argument("--processes", type= int, default= 1, help= "worker processes to start on this machine")
+    worker_parser.add_argument("--workers", type= int, default= 1, help= "concurrent products per process")
+    worker_parser.add_argument("--fetch-engine", default= "browser", choices= list(ShopeeCrawler.FETCH_ENGINES))
+    worker_parser.add_argument("--browser-profile", default= "default")
+    worker_parser.add_argument("--base-url", default= ProductInfoListener.SHOPEE_URL)
+    worker_parser.add_argument("--max-requests-per-second", type= float, default= 5.0)
+    worker_parser.add_argument("--wait", action= "store_true", help= "keep polling when the queue is empty")
+
+    export_parser = subparsers.add_parser("export", help= "merge the results gathered so far")
+    export_parser.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "coordinator":
+        keywords = list(args.keywords)
+        if args.keyword_file is not None:
+            with open(args.keyword_file, "r", encoding= "utf-8") as file:
+                keywords.extend(line.strip() for line in file if line.strip())
+        work_queue = SqliteWorkQueue(args.queue_file, args.lease, is_shared_across_hosts= args.shared_across_hosts)
+        print(f"[Coordinator] queued {queue_keywords(work_queue, keywords, args.pages)} new keywords")
+        print(f"[Coordinator] wrote {run_coordinator(work_queue, args.output, args.poll)} products to {args.output}")
+    elif args.command == "worker":
+        worker_kwargs = {
+            "number_of_workers": args.workers,
+            "fetch_engine": args.fetch_engine,
+            "browser_profile": args.browser_profile,
+            "base_url": args.base_url,
+            "max_requests_per_second": args.max_requests_per_second,
+            "is_waiting_for_work": args.wait
+        }
+        processes = [Process(target= run_worker, args= (args.queue_file, args.lease, args.shared_across_hosts, worker_kwargs)) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        work_queue = SqliteWorkQueue(args.queue_file, args.lease, is_shared_across_hosts= args.shared_across_hosts)
+        print(f"wrote {export_results(work_queue, args.output)} products to {args.output}")
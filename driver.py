@@ -1,38 +1,90 @@
 from __future__ import annotations
 import platform
-from typing import List,Dict
-from selenium.common.exceptions import NoSuchElementException, NoAlertPresentException, UnexpectedAlertPresentException
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys # for pressing command button
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.alert import Alert
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions # for wait
-from selenium.webdriver.support.ui import Select # for dropdown menu selection
-from selenium.webdriver import FirefoxOptions
-from webdriver_manager.firefox import GeckoDriverManager
-
+from typing import List,Dict,Tuple,Callable,Any,TYPE_CHECKING
+from selenium.common.exceptions import NoSuchElementException, NoAlertPresentException, UnexpectedAlertPresentException, TimeoutException
+from contextlib import nullcontext
+from driver_metrics import DriverMetrics, instrument_methods
 
+# selenium.webdriver loads every browser binding and webdriver_manager its http stack, both are imported
+# where a browser is actually driven so processes that never open one start without them
+if TYPE_CHECKING:
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.remote.webelement import WebElement
 
 import time
 
-WebElement = webdriver.remote.webelement.WebElement
 Cookies = List[Dict[str, str]]
+Locator = Tuple[str, str]
+WaitRecord = Dict[str, Any]
+
+
+def summarize_wait_records(wait_records: List[WaitRecord]) -> Dict[str, float]:
+    waited_n_seconds = sum(record["waited_n_seconds"] for record in wait_records)
+    fixed_wait_n_seconds = sum(record["fixed_wait_n_seconds"] for record in wait_records)
+    return {
+        "number_of_waits": len(wait_records),
+        "number_of_timeouts": sum(1 for record in wait_records if record["is_timeout"]),
+        "waited_n_seconds": round(waited_n_seconds, 3),
+        "fixed_wait_n_seconds": round(fixed_wait_n_seconds, 3),
+        "saved_n_seconds": round(fixed_wait_n_seconds - waited_n_seconds, 3)
+    }
+
+# text-only scraping never looks at images, media or web fonts, and static assets can be cached for the whole session
+LEAN_PROFILE_PREFERENCES = {
+    "permissions.default.image": 2,
+    "gfx.downloadable_fonts.enabled": False,
+    "browser.display.use_document_fonts": 0,
+    "media.autoplay.default": 5,
+    "media.mp4.enabled": False,
+    "media.webm.enabled": False,
+    "media.mediasource.enabled": False,
+    "media.hls.enabled": False,
+    "browser.cache.disk.enable": True,
+    "browser.cache.memory.enable": True,
+    "network.http.use-cache": True
+}
+
+DEFAULT_PROFILE_PREFERENCES = {
+    "browser.cache.disk.enable": False,
+    "browser.cache.memory.enable": False,
+    "browser.cache.offline.enable": False,
+    "network.http.use-cache": False
+}
 
+PROFILE_PREFERENCES = {
+    "default": DEFAULT_PROFILE_PREFERENCES,
+    "lean": LEAN_PROFILE_PREFERENCES
+}
+
+@instrument_methods
 class Driver:
-    def __init__(self, is_headless:bool = False, is_full_size_screen:bool = False) -> None:
+    def __init__(self, is_headless:bool = False, is_full_size_screen:bool = False, profile:str = "default", metrics:DriverMetrics | None = None) -> None:
+        assert profile in PROFILE_PREFERENCES, f"{profile} is not one of {list(PROFILE_PREFERENCES)}"
         self.driver = None
         self.searched_element = None
         self.select = None
 
         self.is_headless = is_headless
         self.is_full_size_screen = is_full_size_screen
+        self.profile = profile
+        self.number_of_pages_opened = 0
+        self.wait_records: List[WaitRecord] = []
+        # opt-in, every public method call is timed into it under the stage set with stage()
+        self.metrics = metrics
         
 
+    def stage(self, stage_name:str):
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.stage(stage_name)
+
     def get_current_url(self) -> str:
         return self.driver.current_url
     
+    def get_page_source(self) -> str:
+        return self.driver.page_source
+
     def get_current_page_title(self) -> str:
         return self.driver.title
     
@@ -41,6 +93,9 @@ class Driver:
         return self
 
     def open_firefox_browser(self) -> Driver:
+        from selenium import webdriver
+        from selenium.webdriver import FirefoxOptions
+
         opts = FirefoxOptions()
         if self.is_headless:
             opts.add_argument("--headless")
@@ -48,22 +103,23 @@ class Driver:
         opts.set_preference("general.useragent.override", 
         "userAgent=Mozilla/5.0 (X11; Ubuntu; Linux i686; rv:24.0) Gecko/20100101 Firefox/24.0")
         opts.set_preference("dom.webdriver.enabled", False)
-        opts.set_preference("browser.cache.disk.enable", False)
-        opts.set_preference("browser.cache.memory.enable", False)
-        opts.set_preference("browser.cache.offline.enable", False)
-        opts.set_preference("network.http.use-cache", False) 
+        for preference_name, value in PROFILE_PREFERENCES[self.profile].items():
+            opts.set_preference(preference_name, value)
 
         platform_name = platform.system().lower()
         if "mac" in platform_name:
+            from webdriver_manager.firefox import GeckoDriverManager
             self.driver = webdriver.Firefox(options=opts, executable_path=GeckoDriverManager().install())
         elif "linux" in platform_name:
             self.driver = webdriver.Firefox(options=opts)
         self.driver.delete_all_cookies()
+        self.number_of_pages_opened = 0
         
         return self
 
     def open_url(self, url:str) -> Driver:
         print(f"Open Url: {url}")
+        self.number_of_pages_opened += 1
         self.driver.get(url)
         return self
 
@@ -103,14 +159,17 @@ class Driver:
         return self
         
     def select_by_visible_text(self, text:str) -> Driver:
+        from selenium.webdriver.support.ui import Select
         Select(self.searched_element).select_by_visible_text(text)
         return self
 
     def select_by_value(self, value:str) -> Driver:
+        from selenium.webdriver.support.ui import Select
         Select(self.searched_element).select_by_value(value)
         return self
     
     def press_enter(self) -> Driver:
+        from selenium.webdriver.common.keys import Keys
         self.searched_element.send_keys(Keys.RETURN)
         return self
 
@@ -123,6 +182,9 @@ class Driver:
         return self
     
     def wait_until(self, max_wait_n_seconds:float, by:By,element_name_presented:str) -> Driver:
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions
+
         self.searched_element =  (
             WebDriverWait(self.driver, max_wait_n_seconds).until(
             expected_conditions.presence_of_element_located(
@@ -133,6 +195,9 @@ class Driver:
         return self
     
     def wait_until_clickable(self, max_wait_n_seconds:float, by:By,element_name_clicked:str) -> Driver:
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions
+
         self.searched_element =  (
             WebDriverWait(self.driver, max_wait_n_seconds).until(
             expected_conditions.element_to_be_clickable(
@@ -142,6 +207,50 @@ class Driver:
         )
         return self
     
+    def wait_until_ready(self, max_wait_n_seconds:float, is_ready:Callable[[Driver], bool], fixed_wait_n_seconds:float | None = None, label:str = "") -> Driver:
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        # a timeout is not an error, callers carry on as they did after the fixed sleep this replaces
+        start = time.perf_counter()
+        is_timeout = False
+        try:
+            WebDriverWait(self.driver, max_wait_n_seconds, poll_frequency= 0.2).until(lambda _: is_ready(self))
+        except TimeoutException:
+            is_timeout = True
+
+        return self.record_wait(
+            label, time.perf_counter() - start, max_wait_n_seconds if fixed_wait_n_seconds is None else fixed_wait_n_seconds, is_timeout
+        )
+
+    def record_wait(self, label:str, waited_n_seconds:float, fixed_wait_n_seconds:float, is_timeout:bool = False) -> Driver:
+        # fixed_wait_n_seconds is what the code before the readiness waits slept at this point
+        self.wait_records.append({
+            "label": label,
+            "waited_n_seconds": waited_n_seconds,
+            "fixed_wait_n_seconds": fixed_wait_n_seconds,
+            "is_timeout": is_timeout
+        })
+        return self
+
+    def wait_until_all_present(self, max_wait_n_seconds:float, locators:List[Locator], fixed_wait_n_seconds:float | None = None, label:str = "") -> Driver:
+        return self.wait_until_ready(
+            max_wait_n_seconds, 
+            lambda driver: all(driver.is_element_exists_by(by, element_name) for by, element_name in locators),
+            fixed_wait_n_seconds,
+            label
+        )
+
+    def wait_until_document_loaded(self, max_wait_n_seconds:float, fixed_wait_n_seconds:float | None = None, label:str = "") -> Driver:
+        return self.wait_until_ready(
+            max_wait_n_seconds,
+            lambda driver: driver.driver.execute_script("return document.readyState") == "complete",
+            fixed_wait_n_seconds,
+            label
+        )
+
+    def get_wait_report(self) -> Dict[str, float]:
+        return summarize_wait_records(self.wait_records)
+    
     def refresh(self) -> Driver:
         self.driver.refresh()
         return self
@@ -196,6 +305,40 @@ class Driver:
         self.driver.execute_script(script)
 
         return self
+
+    def execute_script_and_get_result(self, script: str, *args) -> Any:
+        return self.driver.execute_script(script, *args)
+    
+    def is_healthy(self) -> bool:
+        if self.driver is None:
+            return False
+        try:
+            self.driver.current_url
+        except Exception:
+            return False
+        return True
+
+    def get_memory_usage_mb(self) -> float | None:
+        # resident memory of the firefox parent process and its content processes, linux only
+        process_id = self.driver.capabilities.get("moz:processID") if self.driver is not None else None
+        if process_id is None:
+            return
+        try:
+            with open(f"/proc/{process_id}/task/{process_id}/children", "r") as file:
+                process_ids = [process_id] + [int(child_id) for child_id in file.read().split()]
+        except OSError:
+            process_ids = [process_id]
+
+        memory_usage_kb = 0
+        for current_process_id in process_ids:
+            try:
+                with open(f"/proc/{current_process_id}/status", "r") as file:
+                    for line in file:
+                        if line.startswith("VmRSS:"):
+                            memory_usage_kb += int(line.split()[1])
+            except OSError:
+                continue
+        return memory_usage_kb / 1024
     
     def close_browser(self) -> None:
         if self.driver is None:
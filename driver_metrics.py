@@ -0,0 +1,237 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple, Callable, Any
+from contextlib import contextmanager
+from functools import wraps
+from threading import Thread, Lock, Event, local
+import json
+import os
+import time
+
+# upper bounds in seconds, a webdriver command is a few milliseconds while page loads and waits take seconds
+LATENCY_BUCKETS_N_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# what a driver method spends its time on: sleeping, polling for readiness, loading pages or a single webdriver command
+SLEEP_METHODS = {"wait_n_seconds"}
+WAIT_METHODS = {"wait_until", "wait_until_clickable", "wait_until_ready", "wait_until_all_present", "wait_until_document_loaded"}
+NAVIGATION_METHODS = {"open_firefox_browser", "open_url", "refresh", "close_browser"}
+UNINSTRUMENTED_METHODS = {"stage", "get_wait_report", "record_wait"}
+
+DEFAULT_STAGE = "other"
+MetricKey = Tuple[str, str]
+
+
+def get_method_kind(method_name: str) -> str:
+    if method_name in SLEEP_METHODS:
+        return "sleep"
+    if method_name in WAIT_METHODS:
+        return "wait"
+    if method_name in NAVIGATION_METHODS:
+        return "navigation"
+    return "command"
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_N_SECONDS) -> None:
+        self.buckets = buckets
+        # one count per bucket plus the overflow past the last bound
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.number_of_errors = 0
+        self.sum_n_seconds = 0.0
+        self.max_n_seconds = 0.0
+
+    def observe(self, n_seconds: float, is_error: bool = False) -> None:
+        idx = 0
+        while idx < len(self.buckets) and n_seconds > self.buckets[idx]:
+            idx += 1
+        self.bucket_counts[idx] += 1
+        self.count += 1
+        self.number_of_errors += int(is_error)
+        self.sum_n_seconds += n_seconds
+        self.max_n_seconds = max(self.max_n_seconds, n_seconds)
+
+    def get_cumulative_counts(self) -> List[int]:
+        cumulative_counts = []
+        total = 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            cumulative_counts.append(total)
+        return cumulative_counts
+
+    def get_quantile(self, quantile: float) -> float:
+        # upper bound of the bucket holding the quantile, the max stands in for the overflow bucket
+        rank = quantile * self.count
+        for bound, cumulative_count in zip(self.buckets, self.get_cumulative_counts()):
+            if cumulative_count >= rank:
+                return min(bound, self.max_n_seconds)
+        return self.max_n_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "number_of_errors": self.number_of_errors,
+            "sum_n_seconds": round(self.sum_n_seconds, 4),
+            "mean_ms": round(self.sum_n_seconds / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": round(self.get_quantile(0.5) * 1000, 2),
+            "p95_ms": round(self.get_quantile(0.95) * 1000, 2),
+            "max_ms": round(self.max_n_seconds * 1000, 2),
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.get_cumulative_counts()))
+        }
+
+
+class DriverMetrics:
+    # call counts and latency histograms per (stage, driver method), shared by every Driver of a crawl
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS_N_SECONDS) -> None:
+        self.buckets = buckets
+        self.histograms: Dict[MetricKey, LatencyHistogram] = {}
+        self.lock = Lock()
+        self.thread_state = local()
+        self.started_at = time.time()
+
+        self.flush_file_name: str | None = None
+        self.flush_thread: Thread | None = None
+        self.flush_stop_event = Event()
+
+    def get_current_stage(self) -> str:
+        return getattr(self.thread_state, "stage", DEFAULT_STAGE)
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        # the stage is per thread, so workers driving different browsers tag their own calls
+        previous_stage = self.get_current_stage()
+        self.thread_state.stage = stage_name
+        try:
+            yield self
+        finally:
+            self.thread_state.stage = previous_stage
+
+    def record(self, method_name: str, n_seconds: float, is_error: bool = False) -> None:
+        key = (self.get_current_stage(), method_name)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram(self.buckets)
+            histogram.observe(n_seconds, is_error)
+
+    def is_outermost_call(self) -> bool:
+        return getattr(self.thread_state, "depth", 0) == 0
+
+    def _enter_call(self) -> None:
+        self.thread_state.depth = getattr(self.thread_state, "depth", 0) + 1
+
+    def _exit_call(self) -> None:
+        self.thread_state.depth -= 1
+
+    def summarize(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        # seconds and calls per stage and kind, enough to tell webdriver overhead from sleeps and page loads
+        summary: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self.lock:
+            for (stage_name, method_name), histogram in self.histograms.items():
+                kind_summary = summary.setdefault(stage_name, {}).setdefault(
+                    get_method_kind(method_name), {"count": 0, "sum_n_seconds": 0.0}
+                )
+                kind_summary["count"] += histogram.count
+                kind_summary["sum_n_seconds"] = round(kind_summary["sum_n_seconds"] + histogram.sum_n_seconds, 4)
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            methods = [
+                {"stage": stage_name, "method": method_name, "kind": get_method_kind(method_name), **histogram.to_dict()}
+                for (stage_name, method_name), histogram in sorted(self.histograms.items())
+            ]
+        return {
+            "started_at": self.started_at,
+            "reported_at": time.time(),
+            "summary": self.summarize(),
+            "methods": methods
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii= False, indent= 2)
+
+    def to_prometheus(self, metric_prefix: str = "shopee_driver") -> str:
+        metric_name = f"{metric_prefix}_call_duration_seconds"
+        error_metric_name = f"{metric_prefix}_call_errors_total"
+        lines = [
+            f"# HELP {metric_name} Latency of Driver method calls by pipeline stage.",
+            f"# TYPE {metric_name} histogram"
+        ]
+        error_lines = [
+            f"# HELP {error_metric_name} Driver method calls that raised.",
+            f"# TYPE {error_metric_name} counter"
+        ]
+        with self.lock:
+            for (stage_name, method_name), histogram in sorted(self.histograms.items()):
+                labels = f'stage="{stage_name}",method="{method_name}",kind="{get_method_kind(method_name)}"'
+                bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                for bound, cumulative_count in zip(bounds, histogram.get_cumulative_counts()):
+                    lines.append(f'{metric_name}_bucket{{{labels},le="{bound}"}} {cumulative_count}')
+                lines.append(f"{metric_name}_sum{{{labels}}} {histogram.sum_n_seconds:.6f}")
+                lines.append(f"{metric_name}_count{{{labels}}} {histogram.count}")
+                error_lines.append(f"{error_metric_name}{{{labels}}} {histogram.number_of_errors}")
+        return "\n".join(lines + error_lines) + "\n"
+
+    def write_report(self, file_name: str) -> None:
+        # .prom and .txt files get the prometheus text format, anything else json
+        is_prometheus = os.path.splitext(file_name)[1] in (".prom", ".txt")
+        report = self.to_prometheus() if is_prometheus else self.to_json()
+        temp_file_name = f"{file_name}.tmp"
+        with open(temp_file_name, "w", encoding= "utf-8") as file:
+            file.write(report)
+        os.replace(temp_file_name, file_name)
+
+    def _flush_periodically(self, flush_interval_n_seconds: float) -> None:
+        while not self.flush_stop_event.wait(flush_interval_n_seconds):
+            try:
+                self.write_report(self.flush_file_name)
+            except OSError as error:
+                print(f"Failed to flush driver metrics: {error}")
+
+    def start_periodic_flush(self, file_name: str, flush_interval_n_seconds: float = 30) -> DriverMetrics:
+        self.flush_file_name = file_name
+        self.flush_stop_event.clear()
+        self.flush_thread = Thread(target= self._flush_periodically, args= (flush_interval_n_seconds,), daemon= True)
+        self.flush_thread.start()
+        return self
+
+    def stop_periodic_flush(self) -> None:
+        # the final report is written here, so the file always ends up with the whole run
+        if self.flush_thread is None:
+            return
+        self.flush_stop_event.set()
+        self.flush_thread.join()
+        self.flush_thread = None
+        self.write_report(self.flush_file_name)
+
+    def __repr__(self) -> str:
+        return f"DriverMetrics with {sum(histogram.count for histogram in self.histograms.values())} calls over {len(self.histograms)} stage/method pairs"
+
+
+def instrument_methods(cls: type) -> type:
+    # wraps every public method so a Driver with metrics records its calls; without metrics the wrapper is a single check.
+    # only the outermost call of a thread is recorded, the commands a wait polls with are part of that wait's latency.
+    def instrument(method_name: str, method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics: DriverMetrics | None = self.metrics
+            if metrics is None or not metrics.is_outermost_call():
+                return method(self, *args, **kwargs)
+            metrics._enter_call()
+            start = time.perf_counter()
+            is_error = False
+            try:
+                return method(self, *args, **kwargs)
+            except BaseException:
+                is_error = True
+                raise
+            finally:
+                metrics._exit_call()
+                metrics.record(method_name, time.perf_counter() - start, is_error)
+        return wrapper
+
+    for method_name, method in list(vars(cls).items()):
+        if method_name.startswith("_") or method_name in UNINSTRUMENTED_METHODS or not callable(method):
+            continue
+        setattr(cls, method_name, instrument(method_name, method))
+    return cls
@@ -0,0 +1,208 @@
+from __future__ import annotations
+from typing import List, Set, Callable, TypeVar
+from contextlib import contextmanager
+from queue import Queue, Empty
+from threading import Thread, Lock
+from selenium.common.exceptions import WebDriverException
+from driver import Driver, WaitRecord
+
+T = TypeVar("T")
+
+class DriverPool:
+    # hands out warm browser sessions and replaces them when they crash, grow too big or have served too many pages
+    ACQUIRE_POLL_N_SECONDS = 1
+
+    def __init__(
+        self,
+        size: int = 2,
+        driver_factory: Callable[[], Driver] | None = None,
+        warm_up: Callable[[Driver], None] | None = None,
+        max_pages_per_driver: int = 200,
+        max_memory_mb: float | None = None
+    ) -> None:
+        self.size = max(1, size)
+        self.driver_factory = driver_factory or (lambda: Driver(is_headless= False))
+        self.warm_up = warm_up
+        self.max_pages_per_driver = max_pages_per_driver
+        self.max_memory_mb = max_memory_mb
+
+        self.idle_drivers: Queue = Queue()
+        self.live_drivers: Set[Driver] = set()
+        self.number_of_slots_taken = 0
+        self.lock = Lock()
+        self.is_closed = False
+
+        self.number_of_recycled_drivers = 0
+        self.number_of_broken_drivers = 0
+        self.retired_wait_records: List[WaitRecord] = []
+        # called with every driver the pool drops, so whoever keeps state per session can let go of it
+        self.retire_callbacks: List[Callable[[Driver], None]] = []
+
+    def _take_slot(self) -> bool:
+        with self.lock:
+            if self.is_closed or self.number_of_slots_taken >= self.size:
+                return False
+            self.number_of_slots_taken += 1
+            return True
+
+    def _launch(self) -> Driver:
+        # the caller must hold a slot, it is given back if the browser fails to come up
+        driver = self.driver_factory()
+        try:
+            driver.open_firefox_browser()
+            if self.warm_up is not None:
+                self.warm_up(driver)
+        except Exception:
+            self._close_driver(driver)
+            with self.lock:
+                self.number_of_slots_taken -= 1
+            raise
+        with self.lock:
+            self.live_drivers.add(driver)
+        return driver
+
+    def _launch_into_pool(self) -> None:
+        try:
+            driver = self._launch()
+        except Exception as error:
+            print(f"Failed to launch a browser: {error}")
+            return
+        if self.is_closed:
+            self._retire(driver)
+            return
+        self.idle_drivers.put(driver)
+
+    def reopen(self) -> DriverPool:
+        # a closed pool hands out sessions again, launched on demand by acquire() or all at once by start()
+        with self.lock:
+            self.is_closed = False
+        return self
+
+    def start(self) -> DriverPool:
+        # launches every session in the background, acquire() picks them up as they become ready
+        self.reopen()
+        while self._take_slot():
+            Thread(target= self._launch_into_pool, daemon= True).start()
+        return self
+
+    def _close_driver(self, driver: Driver) -> None:
+        try:
+            driver.close_browser()
+        except Exception:
+            # a crashed session can fail to quit, the handle is dropped either way
+            driver._destrctor()
+
+    def _retire(self, driver: Driver) -> None:
+        self._close_driver(driver)
+        with self.lock:
+            if driver in self.live_drivers:
+                self.live_drivers.remove(driver)
+                self.number_of_slots_taken -= 1
+            self.retired_wait_records.extend(driver.wait_records)
+            retire_callbacks = list(self.retire_callbacks)
+        for retire_callback in retire_callbacks:
+            retire_callback(driver)
+
+    def add_retire_callback(self, retire_callback: Callable[[Driver], None]) -> None:
+        with self.lock:
+            if retire_callback not in self.retire_callbacks:
+                self.retire_callbacks.append(retire_callback)
+
+    def remove_retire_callback(self, retire_callback: Callable[[Driver], None]) -> None:
+        with self.lock:
+            if retire_callback in self.retire_callbacks:
+                self.retire_callbacks.remove(retire_callback)
+
+    def _needs_recycling(self, driver: Driver) -> bool:
+        if driver.number_of_pages_opened >= self.max_pages_per_driver:
+            return True
+        if self.max_memory_mb is None:
+            return False
+        memory_usage_mb = driver.get_memory_usage_mb()
+        return memory_usage_mb is not None and memory_usage_mb > self.max_memory_mb
+
+    def acquire(self) -> Driver:
+        while (True):
+            if self.is_closed:
+                raise RuntimeError("DriverPool is closed")
+            try:
+                driver = self.idle_drivers.get_nowait()
+            except Empty:
+                if self._take_slot():
+                    return self._launch()
+                try:
+                    driver = self.idle_drivers.get(timeout= self.ACQUIRE_POLL_N_SECONDS)
+                except Empty:
+                    continue
+
+            if not driver.is_healthy():
+                print("Replacing a crashed browser session.")
+                with self.lock:
+                    self.number_of_broken_drivers += 1
+                self._retire(driver)
+                continue
+            if self._needs_recycling(driver):
+                print(f"Recycling a browser session after {driver.number_of_pages_opened} pages.")
+                with self.lock:
+                    self.number_of_recycled_drivers += 1
+                self._retire(driver)
+                continue
+            return driver
+
+    def release(self, driver: Driver, is_broken: bool = False) -> None:
+        if is_broken or self.is_closed:
+            if is_broken:
+                with self.lock:
+                    self.number_of_broken_drivers += 1
+            self._retire(driver)
+            return
+        self.idle_drivers.put(driver)
+
+    @contextmanager
+    def session(self):
+        driver = self.acquire()
+        is_broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            is_broken = not driver.is_healthy()
+            raise
+        finally:
+            self.release(driver, is_broken)
+
+    def run(self, task: Callable[[Driver], T], max_attempts: int = 3) -> T:
+        # a task interrupted by a crashed session is retried on a fresh one, so the assigned work is not lost
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with self.session() as driver:
+                    result = task(driver)
+                    # tasks that swallow webdriver errors still must not hand back the output of a dead session
+                    if not driver.is_healthy():
+                        raise WebDriverException("Browser session crashed during the task")
+                    return result
+            except WebDriverException as error:
+                if attempt == max_attempts:
+                    raise
+                print(f"Browser session failed ({error.__class__.__name__}), retrying {attempt}/{max_attempts - 1}")
+
+    def get_wait_records(self) -> List[WaitRecord]:
+        with self.lock:
+            wait_records = list(self.retired_wait_records)
+            for driver in self.live_drivers:
+                wait_records.extend(driver.wait_records)
+        return wait_records
+
+    def close(self) -> None:
+        with self.lock:
+            self.is_closed = True
+        while (True):
+            try:
+                self._retire(self.idle_drivers.get_nowait())
+            except Empty:
+                break
+
+    def __repr__(self) -> str:
+        return (
+            f"DriverPool with {len(self.live_drivers)}/{self.size} sessions, "
+            f"{self.number_of_recycled_drivers} recycled, {self.number_of_broken_drivers} replaced after crashing"
+        )
@@ -0,0 +1,272 @@
+from __future__ import annotations
+from typing import Dict, Tuple, Union
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+from threading import Thread, Lock
+from collections import deque
+import html
+import json
+import random
+import re
+import time
+
+# a local stand-in for the search and product pages, built with the same class names and nesting that
+# ProductAddressCrawler and ProductInfoListener select on, so whole crawls can run offline
+
+PRODUCT_PATH_PATTERN = re.compile(r"-i\.(\d+)\.(\d+)$")
+
+PRODUCT_TEMPLATE = """
+<div class="product-briefing">
+    <div class="_44qnta">{product_name}</div>
+    <div class="rating-summary">
+        <div class="IZIVH+ _046PXf">{number_of_stars}</div>
+        <div class="IZIVH+">{number_of_comments}</div>
+    </div>
+    <div class="jgUbWJ">{quantity_sold}</div>
+    <div class="pqTWkA">{price_range}</div>
+    <div class="_7K5or9">{free_shipment_fee_threshold}</div>
+    <div class="_6lioXX">{quantity_remaining}</div>
+    <div class="social">
+        <div class="share">share</div>
+        <div class="Ne7dEf">{number_of_likes}</div>
+    </div>
+</div>
+<div class="shop-section">
+    <div class="Odudp+">
+        <div><span>評價</span><span>{number_of_market_comments}</span></div>
+        <div><span>商品</span><span class="vUG3KX">{number_of_market_product}</span></div>
+    </div>
+    <div class="Odudp+">
+        <div><span>聊聊回應率</span><span>{chat_response_rate}</span></div>
+        <div><span>回應速度</span><span>{chat_response_speed}</span></div>
+    </div>
+    <div class="Odudp+">
+        <div>{join_time}</div>
+        <div>{number_of_fans}</div>
+    </div>
+</div>
+"""
+
+# client side rendering: nothing is in the dom until the render delay passes, search tiles then arrive one batch per scroll
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+<div id="main">{server_rendered_content}</div>
+<script>
+const renderDelayMilliseconds = {render_delay_milliseconds};
+const clientRenderedContent = {client_rendered_content};
+const tileBatches = {tile_batches};
+const main = document.getElementById("main");
+let nextTileBatch = 0;
+const appendTileBatch = () => {{
+    const items = document.querySelector(".shopee-search-item-result__items");
+    if (items === null || nextTileBatch >= tileBatches.length) return;
+    items.insertAdjacentHTML("beforeend", tileBatches[nextTileBatch]);
+    nextTileBatch += 1;
+}};
+if (clientRenderedContent !== null) {{
+    setTimeout(() => {{
+        main.innerHTML = clientRenderedContent;
+        appendTileBatch();
+    }}, renderDelayMilliseconds);
+    window.addEventListener("scroll", () => setTimeout(appendTileBatch, renderDelayMilliseconds));
+}}
+</script>
+</body>
+</html>
+"""
+
+
+class FixtureSite:
+    TILES_PER_SCROLL = 15
+
+    def __init__(
+        self,
+        number_of_pages: int = 3,
+        products_per_page: int = 60,
+        render_delay_n_seconds: float = 0.0,
+        response_delay_n_seconds: float = 0.0,
+        is_server_rendered: bool = True,
+        blocked_above_requests_per_second: float | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ) -> None:
+        self.number_of_pages = number_of_pages
+        self.products_per_page = products_per_page
+        # render delay is spent in the browser after the response, response delay on the server before it
+        self.render_delay_n_seconds = render_delay_n_seconds
+        self.response_delay_n_seconds = response_delay_n_seconds
+        self.is_server_rendered = is_server_rendered
+        # item id -> amount added to its price, shown on both its search tile and its product page
+        self.price_changes: Dict[int, int] = {}
+        # like the real site, a client asking for more pages per second than this is sent to the verification page
+        self.blocked_above_requests_per_second = blocked_above_requests_per_second
+        self.recent_request_times = deque()
+        self.number_of_requests: Dict[str, int] = {"home": 0, "search": 0, "product": 0, "blocked": 0, "verify": 0, "other": 0}
+        self.lock = Lock()
+        self.server = ThreadingHTTPServer((host, port), self._create_handler())
+        self.server.daemon_threads = True
+        self.thread: Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def get_product_path(self, page_num: int, position: int) -> str:
+        item_id = page_num * self.products_per_page + position + 1
+        shop_id = 1000 + item_id % 17
+        return f"fixture-product-{item_id}-i.{shop_id}.{item_id}"
+
+    def change_price(self, item_id: int, price_change: int) -> None:
+        self.price_changes[item_id] = self.price_changes.get(item_id, 0) + price_change
+
+    def _get_low_price(self, item_id: int) -> int:
+        return random.Random(item_id).randint(50, 5000) + self.price_changes.get(item_id, 0)
+
+    def _render_product(self, shop_id: int, item_id: int) -> str:
+        # every value is derived from the item id, so repeated runs scrape identical data
+        generator = random.Random(item_id)
+        generator.randint(50, 5000)
+        low_price = self._get_low_price(item_id)
+        return PRODUCT_TEMPLATE.format(
+            product_name= html.escape(f"{'優選 ' if item_id % 5 == 0 else ''}Fixture Product {item_id}"),
+            number_of_stars= round(generator.uniform(3, 5), 1),
+            number_of_comments= f"{round(generator.uniform(1, 9), 1)}千",
+            quantity_sold= f"已售出 {generator.randint(1, 999)}",
+            price_range= f"${low_price} - ${low_price + generator.randint(0, 500)}",
+            free_shipment_fee_threshold= f"滿${generator.choice([99, 199, 299])}免運",
+            quantity_remaining= f"還剩 {generator.randint(0, 9999)} 件",
+            number_of_likes= f"已按讚 ({generator.randint(0, 999)})",
+            number_of_market_comments= f"{round(generator.uniform(1, 99), 1)}萬",
+            number_of_market_product= generator.randint(1, 3000),
+            chat_response_rate= f"{generator.randint(50, 100)}%",
+            chat_response_speed= generator.choice(["幾分鐘內", "幾小時內", "幾天內"]),
+            join_time= f"{generator.randint(1, 11)} 個月" if shop_id % 2 == 0 else f"{generator.randint(1, 8)} 年",
+            number_of_fans= f"{round(generator.uniform(1, 50), 1)}萬"
+        )
+
+    def _render_search_page(self, page_num: int) -> Tuple[str, list]:
+        tiles = []
+        for position in range(self.products_per_page):
+            item_id = page_num * self.products_per_page + position + 1
+            tiles.append(
+                f'<a href="/{self.get_product_path(page_num, position)}?sp_atk=fixture-{page_num}-{position}">'
+                f'<div>Fixture Product {item_id}</div><div>${self._get_low_price(item_id)}</div></a>'
+            )
+        frame = (
+            f'<div class="shopee-mini-page-controller__total">{self.number_of_pages}</div>'
+            '<div class="shopee-search-item-result__items">{tiles}</div>'
+        )
+        return frame, tiles
+
+    def _render_page(self, title: str, content: str, tile_batches: list | None = None) -> str:
+        if self.is_server_rendered:
+            tiles = "".join(tile_batches or [])
+            return PAGE_TEMPLATE.format(
+                title= title,
+                server_rendered_content= content.replace("{tiles}", tiles),
+                render_delay_milliseconds= 0,
+                client_rendered_content= "null",
+                tile_batches= "[]"
+            )
+        return PAGE_TEMPLATE.format(
+            title= title,
+            server_rendered_content= "",
+            render_delay_milliseconds= int(self.render_delay_n_seconds * 1000),
+            client_rendered_content= json.dumps(content.replace("{tiles}", "")),
+            tile_batches= json.dumps(tile_batches or [])
+        )
+
+    def is_blocked(self) -> bool:
+        # search and product requests over the last second, the one being handled included
+        if self.blocked_above_requests_per_second is None:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self.recent_request_times.append(now)
+            while self.recent_request_times[0] < now - 1:
+                self.recent_request_times.popleft()
+            return len(self.recent_request_times) > self.blocked_above_requests_per_second
+
+    def render(self, path: str, query: Dict[str, list]) -> Union[None, Tuple[str, str]]:
+        # returns the request kind and the page, or None for an unknown path
+        if path == "/":
+            return "home", self._render_page("Fixture Shopee", "<div>home</div>")
+        if path.startswith("/verify/"):
+            return "verify", self._render_page("verification", "<div>please verify you are human</div>")
+        if path == "/search":
+            page_num = int(query.get("page", ["0"])[0])
+            frame, tiles = self._render_search_page(page_num)
+            tile_batches = [
+                "".join(tiles[start:start + self.TILES_PER_SCROLL])
+                for start in range(0, len(tiles), self.TILES_PER_SCROLL)
+            ]
+            return "search", self._render_page(f"search page {page_num}", frame, tile_batches)
+        matched = PRODUCT_PATH_PATTERN.search(path)
+        if matched is not None:
+            shop_id, item_id = (int(group) for group in matched.groups())
+            return "product", self._render_page(f"product {item_id}", self._render_product(shop_id, item_id))
+        return
+
+    def _create_handler(self) -> type:
+        site = self
+
+        class FixtureRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes, nagle would add a delayed-ack stall to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                parsed_url = urlparse(self.path)
+                is_crawled_page = parsed_url.path == "/search" or PRODUCT_PATH_PATTERN.search(parsed_url.path) is not None
+                if is_crawled_page and site.is_blocked():
+                    with site.lock:
+                        site.number_of_requests["blocked"] += 1
+                    self._redirect(f"/verify/traffic?next={quote(self.path, safe= '')}")
+                    return
+                rendered = site.render(parsed_url.path, parse_qs(parsed_url.query))
+                if site.response_delay_n_seconds > 0:
+                    time.sleep(site.response_delay_n_seconds)
+                kind, page = rendered if rendered is not None else ("other", "not found")
+                with site.lock:
+                    site.number_of_requests[kind] += 1
+                self._send(200 if rendered is not None else 404, page)
+
+            def _send(self, status: int, page: str) -> None:
+                body = page.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _redirect(self, location: str) -> None:
+                self.send_response(302)
+                self.send_header("Location", location)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return FixtureRequestHandler
+
+    def start(self) -> FixtureSite:
+        self.thread = Thread(target= self.server.serve_forever, daemon= True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        # shutdown() waits for serve_forever to return, it would block forever on a site that was never started
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
+
+    def __enter__(self) -> FixtureSite:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
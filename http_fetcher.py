@@ -0,0 +1,155 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple, Union
+from functools import lru_cache
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import html
+from lxml.cssselect import CSSSelector
+from product_info_parser import to_info_dict, ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME
+from crawl_rate_controller import CrawlBlockedError, is_blocked_url
+from page_archive import PageArchive
+
+HtmlElement = html.HtmlElement
+# a search result as (product url, tile text), the tile shows the name, price and sold count
+ProductTile = Tuple[str, str]
+
+
+@lru_cache(maxsize= None)
+def _compile_css_selector(element_name: str) -> CSSSelector:
+    return CSSSelector(element_name)
+
+
+def _find_first_element(document: HtmlElement, element_type: str, element_name: str) -> Union[None, HtmlElement]:
+    if element_type == "css selector":
+        elements = _compile_css_selector(element_name)(document)
+    elif element_type == "class name":
+        elements = document.find_class(element_name)
+    elif element_type == "id":
+        elements = document.xpath("//*[@id=$element_id]", element_id= element_name)
+    elif element_type == "tag name":
+        elements = document.xpath(f"//{element_name}")
+    elif element_type == "xpath":
+        elements = document.xpath(element_name)
+    else:
+        raise ValueError(f"Unsupported element type: {element_type}")
+
+    return elements[0] if len(elements) != 0 else None
+
+
+def _get_text(element: HtmlElement) -> str:
+    # no layout without a browser, so whitespace is collapsed the way inline text renders
+    return " ".join(element.text_content().split())
+
+
+def parse_product_raw_texts(
+    page_source: str,
+    item_with_element_type_and_element_name: Dict[str, Tuple[str, str]] = ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME
+) -> Dict[str, Union[None, str]]:
+    document = html.fromstring(page_source)
+    raw_texts = {}
+    for item_name, (element_type, element_name) in item_with_element_type_and_element_name.items():
+        element = _find_first_element(document, element_type, element_name)
+        raw_texts[item_name] = None if element is None else _get_text(element)
+    return raw_texts
+
+
+def parse_product_info_dict(page_source: str, product_url: str, is_normalized: bool = True) -> Union[None, Dict[str, str]]:
+    raw_texts = parse_product_raw_texts(page_source)
+    # the product name is rendered by javascript on the live site, without it the page needs a browser
+    if raw_texts["product_name"] is None:
+        return
+    return to_info_dict(raw_texts, product_url, is_normalized= is_normalized)
+
+
+def parse_search_page_tiles(page_source: str, page_url: str) -> Union[None, List[ProductTile]]:
+    document = html.fromstring(page_source)
+    result_items = document.find_class("shopee-search-item-result__items")
+    if len(result_items) == 0:
+        return
+    return [(urljoin(page_url, anchor.get("href")), _get_text(anchor)) for anchor in result_items[0].iter("a") if anchor.get("href")]
+
+
+def parse_search_page_urls(page_source: str, page_url: str) -> Union[None, List[str]]:
+    tiles = parse_search_page_tiles(page_source, page_url)
+    if tiles is None:
+        return
+    return [url for url, _ in tiles]
+
+
+def parse_total_number_of_pages(page_source: str) -> Union[None, int]:
+    document = html.fromstring(page_source)
+    page_totals = document.find_class("shopee-mini-page-controller__total")
+    if len(page_totals) == 0:
+        return
+    return int(_get_text(page_totals[0]))
+
+
+class HttpFetcher:
+    USER_AGENT = "Mozilla/5.0 (X11; Ubuntu; Linux i686; rv:24.0) Gecko/20100101 Firefox/24.0"
+
+    def __init__(self, pool_size: int = 10, timeout: float = 10, max_retries: int = 2) -> None:
+        self.timeout = timeout
+        self.is_normalized = True
+        # when set, every product and search page fetched is kept for offline re-extraction
+        self.archive: PageArchive | None = None
+        self.session = requests.Session()
+        # one keep-alive pool per host, sized for the number of workers sharing this fetcher
+        adapter = HTTPAdapter(
+            pool_connections= pool_size,
+            pool_maxsize= pool_size,
+            max_retries= Retry(total= max_retries, backoff_factor= 0.5, status_forcelist= [500, 502, 503, 504])
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": self.USER_AGENT})
+
+    def get_page_source(self, url: str) -> Union[None, Tuple[str, str]]:
+        # a redirect to the verification or login page, or a 429, is raised so the caller can back off
+        try:
+            response = self.session.get(url, timeout= self.timeout)
+            if response.status_code == 429 or is_blocked_url(response.url):
+                raise CrawlBlockedError(response.url)
+            response.raise_for_status()
+        except requests.RequestException as error:
+            print(f"Failed to fetch {url}: {error}")
+            return
+        # requests falls back to latin-1 for text/html without a charset, the site is always utf-8
+        if "charset" not in response.headers.get("content-type", "").lower():
+            response.encoding = "utf-8"
+        return response.url, response.text
+
+    def fetch_product_info_dict(self, url: str) -> Union[None, Dict[str, str]]:
+        response = self.get_page_source(url)
+        if response is None:
+            return
+        final_url, page_source = response
+        if self.archive is not None:
+            self.archive.archive(final_url, page_source, "product")
+        return parse_product_info_dict(page_source, final_url, self.is_normalized)
+
+    def fetch_search_page_tiles(self, url: str) -> Union[None, List[ProductTile]]:
+        response = self.get_page_source(url)
+        if response is None:
+            return
+        final_url, page_source = response
+        if self.archive is not None:
+            self.archive.archive(final_url, page_source, "search")
+        return parse_search_page_tiles(page_source, final_url)
+
+    def fetch_search_page_urls(self, url: str) -> Union[None, List[str]]:
+        tiles = self.fetch_search_page_tiles(url)
+        if tiles is None:
+            return
+        return [url for url, _ in tiles]
+
+    def fetch_total_number_of_pages(self, url: str) -> Union[None, int]:
+        response = self.get_page_source(url)
+        if response is None:
+            return
+        _, page_source = response
+        return parse_total_number_of_pages(page_source)
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import List, Dict, Iterator, Any
+from threading import Lock, get_ident
+import gzip
+import hashlib
+import json
+import os
+import time
+
+ArchiveEntry = Dict[str, Any]
+
+
+class PageArchive:
+    # page sources stored once per distinct content under objects/<first 2 hex>/<sha256>.html.gz,
+    # index.jsonl records every visit as url, kind, digest and time, so a page seen on many days costs one file
+    PAGE_KINDS = ("product", "search")
+
+    def __init__(self, directory: str, compress_level: int = 6) -> None:
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.index_file_name = os.path.join(directory, "index.jsonl")
+        self.compress_level = compress_level
+        self.lock = Lock()
+        self.number_of_pages_archived = 0
+        self.number_of_objects_written = 0
+        os.makedirs(self.objects_directory, exist_ok= True)
+
+    def _get_object_file_name(self, digest: str) -> str:
+        return os.path.join(self.objects_directory, digest[:2], f"{digest}.html.gz")
+
+    def archive(self, url: str, page_source: str, kind: str) -> str:
+        assert kind in self.PAGE_KINDS, f"{kind} is not one of {self.PAGE_KINDS}"
+        content = page_source.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        object_file_name = self._get_object_file_name(digest)
+        is_new_object = not os.path.exists(object_file_name)
+        if is_new_object:
+            os.makedirs(os.path.dirname(object_file_name), exist_ok= True)
+            # written next to its final name and renamed, so a reader never sees half an object
+            temp_file_name = f"{object_file_name}.{os.getpid()}.{get_ident()}.tmp"
+            with open(temp_file_name, "wb") as file:
+                file.write(gzip.compress(content, compresslevel= self.compress_level))
+            os.replace(temp_file_name, object_file_name)
+
+        entry = {"url": url, "kind": kind, "digest": digest, "archived_at": time.time()}
+        with self.lock:
+            with open(self.index_file_name, "a", encoding= "utf-8") as file:
+                file.write(json.dumps(entry, ensure_ascii= False) + "\n")
+            self.number_of_pages_archived += 1
+            self.number_of_objects_written += int(is_new_object)
+        return digest
+
+    def read(self, digest: str) -> str:
+        with open(self._get_object_file_name(digest), "rb") as file:
+            return gzip.decompress(file.read()).decode("utf-8")
+
+    def iter_entries(self, kind: str | None = None, is_latest_only: bool = True) -> Iterator[ArchiveEntry]:
+        if not os.path.exists(self.index_file_name):
+            return
+        with open(self.index_file_name, "r", encoding= "utf-8") as file:
+            entries = (json.loads(line) for line in file if line.strip())
+            entries = (entry for entry in entries if kind is None or entry["kind"] == kind)
+            if not is_latest_only:
+                yield from entries
+                return
+            # the index is append-only, so the last line of a url is its latest version
+            latest_entries: Dict[str, ArchiveEntry] = {}
+            for entry in entries:
+                latest_entries[entry["url"]] = entry
+        yield from latest_entries.values()
+
+    def get_entries(self, kind: str | None = None, is_latest_only: bool = True) -> List[ArchiveEntry]:
+        return list(self.iter_entries(kind, is_latest_only))
+
+    def __repr__(self) -> str:
+        return f"PageArchive at {self.directory}, {self.number_of_pages_archived} pages archived into {self.number_of_objects_written} new objects"
@@ -1,42 +1,149 @@
 from __future__ import annotations
-from typing import List
+from typing import List, Dict, Tuple, Union, Iterator, Any, Callable, TypeVar
+from queue import Queue
+from threading import Thread
 import time
-from driver import Driver
+from driver import Driver, WaitRecord
+from driver_pool import DriverPool
+from driver_metrics import DriverMetrics
+from http_fetcher import HttpFetcher, ProductTile
+from product_info import get_product_key
+from crawl_rate_controller import CrawlRateController, CrawlBlockedError, is_blocked_url
+from page_archive import PageArchive
+
+T = TypeVar("T")
+
+# every tile of the result grid in one round trip, instead of one get_attribute per anchor
+PRODUCT_TILES_SCRIPT = """
+const items = document.querySelector(".shopee-search-item-result__items");
+if (items === null) return [];
+return Array.from(items.querySelectorAll("a")).filter(anchor => anchor.href).map(anchor => [anchor.href, anchor.innerText]);
+"""
+
+
+def summarize_scroll_stats(scroll_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    number_of_pages = len(scroll_stats)
+    if number_of_pages == 0:
+        return {"number_of_pages": 0}
+    return {
+        "number_of_pages": number_of_pages,
+        "average_number_of_scroll_steps": round(sum(stats["number_of_scroll_steps"] for stats in scroll_stats) / number_of_pages, 2),
+        "average_scroll_n_seconds": round(sum(stats["scroll_n_seconds"] for stats in scroll_stats) / number_of_pages, 3),
+        "number_of_pages_fully_loaded": sum(1 for stats in scroll_stats if stats["is_fully_loaded"])
+    }
 
 class ProductAddressCrawler:
-    def __init__(self, keyword: str, number_of_page_collected: None | int = None):
+    PAGE_READY_TIMEOUT = 5
+    # how long a scroll step waits for new tiles before the grid counts as fully loaded
+    SCROLL_STEP_TIMEOUT = 3
+    MAX_SCROLL_STEPS = 12
+    # the fixed scrolling this replaced slept 3 seconds after each of 6 scrolls, whatever the grid did
+    FIXED_SCROLL_SLEEP_N_SECONDS = 6 * 3
+    NUMBER_OF_PRODUCTS_PER_PAGE = 60
+    # how long an open verification page is given to be solved by hand before the crawl carries on
+    BLOCKED_PAGE_TIMEOUT = 30
+    MAX_BLOCKED_ATTEMPTS = 3
+    
+    def __init__(
+        self,
+        keyword: str,
+        number_of_page_collected: None | int = None,
+        fetcher: HttpFetcher | None = None,
+        number_of_workers: int = 1,
+        browser_profile: str = "default",
+        base_url: str = "https://shopee.tw/",
+        metrics: DriverMetrics | None = None,
+        rate_controller: CrawlRateController | None = None,
+        archive: PageArchive | None = None,
+        driver_pool: DriverPool | None = None
+    ) -> None:
         self.keyword = keyword
         self.number_of_page_collected = number_of_page_collected
-        self.product_list_url = f"https://shopee.tw/search?keyword={keyword}"
-        self.driver = Driver(is_headless= False)
+        self.base_url = base_url
+        self.product_list_url = f"{base_url}search?keyword={keyword}"
+        self.driver = Driver(is_headless= False, profile= browser_profile, metrics= metrics)
+        self.browser_profile = browser_profile
+        self.metrics = metrics
+        self.rate_controller = rate_controller
+        self.archive = archive
+        # when set, search pages borrow a warm browser from the pool and hand it back, instead of launching and quitting one
+        self.driver_pool = driver_pool
+        self.fetcher = fetcher
+        self.number_of_workers = max(1, number_of_workers)
+        self.workers: List[ProductAddressCrawler] = []
+        self.scroll_stats: List[Dict[str, Any]] = []
         
         self.total_number_of_pages:int = 0
         self.query_urls = []
         
         
+    def _open_browser(self) -> Driver:
+        if self.driver_pool is None:
+            return self.driver.open_firefox_browser()
+        self.driver = self.driver_pool.acquire()
+        return self.driver
+
+    def _close_browser(self) -> None:
+        if self.driver_pool is None or self.driver.driver is None:
+            self.driver.close_browser()
+            return
+        self.driver_pool.release(self.driver, is_broken= not self.driver.is_healthy())
+        # an unopened driver again, so the next search page knows it has no browser
+        self.driver = Driver(is_headless= False, profile= self.browser_profile, metrics= self.metrics)
+
     def _go_to_query_url(self) -> ProductAddressCrawler:
-        self.driver.open_firefox_browser().open_url(self.product_list_url).wait_n_seconds(5)
+        self._open_browser().open_url(self.product_list_url)
+        self.driver.wait_until_all_present(
+            self.PAGE_READY_TIMEOUT, [("class name", "shopee-mini-page-controller__total")], label= "search"
+        )
         
         
             
         return self
     
    
-    def _scroll_to_button(self) -> None:
-        for scroll in range(6):
+    def _count_product_anchors(self) -> int:
+        return len(self.driver.find_multiple_elements_by("css selector", ".shopee-search-item-result__items a"))
+   
+    def _scroll_to_button(self, query_url: str = "") -> None:
+        # scroll until the grid holds a full page of products, or stops growing for a whole step
+        start = time.perf_counter()
+        number_of_scroll_steps = 0
+        number_of_anchors = self._count_product_anchors()
+        while number_of_scroll_steps < self.MAX_SCROLL_STEPS and number_of_anchors < self.NUMBER_OF_PRODUCTS_PER_PAGE:
+            previous_number_of_anchors = number_of_anchors
             self.driver.execute_script('window.scrollBy(0,1000)')
-            time.sleep(3)
-        print("Till Button")
+            number_of_scroll_steps += 1
+            # the fixed sleep of the whole page is counted once, on the first step
+            self.driver.wait_until_ready(
+                self.SCROLL_STEP_TIMEOUT, 
+                lambda _: self._count_product_anchors() > previous_number_of_anchors, 
+                fixed_wait_n_seconds= self.FIXED_SCROLL_SLEEP_N_SECONDS if number_of_scroll_steps == 1 else 0,
+                label= "scroll"
+            )
+            number_of_anchors = self._count_product_anchors()
+            if number_of_anchors == previous_number_of_anchors:
+                break
+        if number_of_scroll_steps == 0:
+            self.driver.record_wait("scroll", 0, self.FIXED_SCROLL_SLEEP_N_SECONDS)
+
+        self.scroll_stats.append({
+            "query_url": query_url,
+            "number_of_scroll_steps": number_of_scroll_steps,
+            "scroll_n_seconds": round(time.perf_counter() - start, 3),
+            "number_of_anchors": number_of_anchors,
+            "is_fully_loaded": number_of_anchors >= self.NUMBER_OF_PRODUCTS_PER_PAGE
+        })
+        print(f"Till Button after {number_of_scroll_steps} scrolls, {number_of_anchors} products")
             
-    def get_all_product_urls(self) -> List[str]:
+    def get_all_product_tiles(self) -> List[ProductTile]:
         print("Scraping...")
-        if not self.driver.is_element_exists_by("class name", "shopee-search-item-result__items"):
-            return []
-        
-        all_anchor_tags = self.driver.find_element_by("class name", "shopee-search-item-result__items").searched_element.find_elements("tag name", "a")
+        all_tiles = [(url, tile_text) for url, tile_text in self.driver.execute_script_and_get_result(PRODUCT_TILES_SCRIPT)]
         print("collected.")
-        all_urls = [tag.get_attribute("href") for tag in all_anchor_tags]
-        return all_urls
+        return all_tiles
+
+    def get_all_product_urls(self) -> List[str]:
+        return [url for url, _ in self.get_all_product_tiles()]
     
     def _get_total_number_of_pages(self) -> int:
         self.driver.wait_until(5,"class name", "shopee-mini-page-controller__total")
@@ -44,39 +151,186 @@ class ProductAddressCrawler:
         return int(self.driver.find_element_by("class name", "shopee-mini-page-controller__total").searched_element.text)
     
     def _is_in_search_page(self) -> bool:
-        return "shopee.tw/search?keyword" in self.driver.get_current_url()
+        return f"{self.base_url}search?keyword" in self.driver.get_current_url()
     
     def _is_in_verification_page(self) -> bool:
-        return "verify" in self.driver.get_current_url()
+        return is_blocked_url(self.driver.get_current_url())
+
+    def _wait_until_in_search_page(self) -> None:
+        # returns as soon as a verification page is solved, instead of polling the url once a second
+        self.driver.wait_until_ready(self.BLOCKED_PAGE_TIMEOUT, lambda _: self._is_in_search_page(), label= "blocked")
+
+    def _request(self, fetch: Callable[[str], T], url: str, wait_while_blocked: Callable[[], None] | None = None) -> T:
+        # a blocked request slows the controller down and is tried again at the new pace, the last block is raised.
+        # wait_while_blocked runs before each attempt and outside of the timed request, it is not a slow response
+        if self.rate_controller is None:
+            if wait_while_blocked is not None:
+                wait_while_blocked()
+            return fetch(url)
+        for attempt in range(1, self.MAX_BLOCKED_ATTEMPTS + 1):
+            try:
+                if wait_while_blocked is not None:
+                    wait_while_blocked()
+                with self.rate_controller.request(url):
+                    return fetch(url)
+            except CrawlBlockedError:
+                if attempt == self.MAX_BLOCKED_ATTEMPTS:
+                    raise
+                print(f"Blocked on {url}, retrying {attempt}/{self.MAX_BLOCKED_ATTEMPTS - 1}")
     
-    def collect_product_urls(self) -> List[str]:
-        
-        self._go_to_query_url()
-        while (True):
-            if self._is_in_search_page():
-                break
-            time.sleep(1.0)
-        
-        self.total_number_of_pages = self._get_total_number_of_pages()
-        
-        all_product_urls = []
-        all_urls = [ f"https://shopee.tw/search?keyword={self.keyword}&page={page_num}" 
+    def _get_query_urls(self) -> List[str]:
+        return [ f"{self.product_list_url}&page={page_num}" 
         for page_num in range(self.number_of_page_collected or self.total_number_of_pages) ]
-        
-        while (True):    
-            if not self._is_in_search_page():
-                time.sleep(1.0)
+
+    def _open_search_page_in_browser(self) -> None:
+        with self.driver.stage("search"):
+            self._go_to_query_url()
+            self._wait_until_in_search_page()
+
+    def _wait_while_blocked_in_browser(self) -> None:
+        with self.driver.stage("blocked"):
+            self._wait_until_in_search_page()
+
+    def _get_product_tiles_in_browser(self, query_url: str) -> List[ProductTile]:
+        with self.driver.stage("search"):
+            self.driver.open_url(query_url)
+            if self._is_in_verification_page():
+                raise CrawlBlockedError(self.driver.get_current_url())
+            with self.driver.stage("scroll"):
+                self._scroll_to_button(query_url)
+            if self.archive is not None:
+                self.archive.archive(self.driver.get_current_url(), self.driver.get_page_source(), "search")
+            return self.get_all_product_tiles()
+
+    def _fetch_total_number_of_pages_over_http(self) -> Union[None, int]:
+        if self.fetcher is None:
+            return
+        if self.number_of_page_collected is not None:
+            return self.number_of_page_collected
+        return self._request(self.fetcher.fetch_total_number_of_pages, self.product_list_url)
+
+    def _find_total_number_of_pages(self) -> int:
+        total_number_of_pages = self._fetch_total_number_of_pages_over_http()
+        if total_number_of_pages is not None:
+            return total_number_of_pages
+        self._open_search_page_in_browser()
+        with self.driver.stage("search"):
+            return self._get_total_number_of_pages()
+
+    def _get_product_tiles(self, query_url: str) -> List[ProductTile]:
+        # once a search page needed the browser, the rest of this crawler's pages stay in the browser
+        is_browser_opened = self.driver.driver is not None
+        if self.fetcher is not None and not is_browser_opened:
+            current_page_tiles = self._request(self.fetcher.fetch_search_page_tiles, query_url)
+            if current_page_tiles is not None:
+                return current_page_tiles
+            print("Search pages need javascript, falling back to the browser.")
+        if not is_browser_opened:
+            self._open_search_page_in_browser()
+        return self._request(self._get_product_tiles_in_browser, query_url, self._wait_while_blocked_in_browser)
+
+    def _iter_search_pages(self, query_urls: List[Tuple[int, str]]) -> Iterator[Tuple[int, List[ProductTile]]]:
+        try:
+            for page_num, query_url in query_urls:
+                try:
+                    yield page_num, self._get_product_tiles(query_url)
+                except Exception as error:
+                    print(f"Failed to collect {query_url}: {error}")
+                    yield page_num, []
+        finally:
+            self._close_browser()
+
+    def _put_search_pages(self, query_urls: List[Tuple[int, str]], result_queue: Queue) -> None:
+        try:
+            for page_num_and_tiles in self._iter_search_pages(query_urls):
+                result_queue.put(page_num_and_tiles)
+        except Exception as error:
+            print(f"Search page worker stopped: {error}")
+        finally:
+            result_queue.put(None)
+
+    def _iter_product_tiles_in_parallel(self, query_urls: List[Tuple[int, str]]) -> Iterator[List[ProductTile]]:
+        # this crawler is the first worker, every other worker drives its own browser over a shard of the pages
+        number_of_workers = min(self.number_of_workers, len(query_urls))
+        workers = [self] + [
+            ProductAddressCrawler(
+                self.keyword,
+                self.number_of_page_collected,
+                self.fetcher,
+                browser_profile= self.browser_profile,
+                base_url= self.base_url,
+                metrics= self.metrics,
+                rate_controller= self.rate_controller,
+                archive= self.archive,
+                driver_pool= self.driver_pool
+            )
+            for _ in range(number_of_workers - 1)
+        ]
+        self.workers = workers[1:]
+        result_queue = Queue()
+        for worker_id, worker in enumerate(workers):
+            Thread(target= worker._put_search_pages, args= (query_urls[worker_id::number_of_workers], result_queue)).start()
+
+        # pages finish out of order, they are held back until every earlier page has been yielded
+        pending_pages: Dict[int, List[ProductTile]] = {}
+        next_page_num = 0
+        number_of_finished_workers = 0
+        while number_of_finished_workers < number_of_workers:
+            page_num_and_tiles = result_queue.get()
+            if page_num_and_tiles is None:
+                number_of_finished_workers += 1
                 continue
-            for query_url in all_urls:
-                self.driver.open_url(query_url)
-                self._scroll_to_button()
-                current_page_product_urls = self.get_all_product_urls()
-                all_product_urls.append(current_page_product_urls)
-            break
-            
-        
-        
-        self.driver.close_browser()
-        
-        return sum(all_product_urls, [])
-    
\ No newline at end of file
+            page_num, current_page_tiles = page_num_and_tiles
+            pending_pages[page_num] = current_page_tiles
+            while next_page_num in pending_pages:
+                yield pending_pages.pop(next_page_num)
+                next_page_num += 1
+        for page_num in sorted(pending_pages):
+            yield pending_pages[page_num]
+
+    def iter_product_tiles(self) -> Iterator[List[ProductTile]]:
+        # yields the tiles of one search page at a time in page order, so product scraping can start on the first page
+        try:
+            self.total_number_of_pages = self._find_total_number_of_pages()
+        except Exception:
+            self._close_browser()
+            raise
+        query_urls = list(enumerate(self._get_query_urls()))
+
+        if self.number_of_workers == 1 or len(query_urls) <= 1:
+            for _, current_page_tiles in self._iter_search_pages(query_urls):
+                yield current_page_tiles
+            return
+        yield from self._iter_product_tiles_in_parallel(query_urls)
+
+    def iter_product_urls(self) -> Iterator[List[str]]:
+        for current_page_tiles in self.iter_product_tiles():
+            yield [url for url, _ in current_page_tiles]
+
+    def get_wait_records(self) -> List[WaitRecord]:
+        wait_records = list(self.driver.wait_records)
+        for worker in self.workers:
+            wait_records.extend(worker.driver.wait_records)
+        return wait_records
+    
+    def get_scroll_stats(self) -> List[Dict[str, Any]]:
+        scroll_stats = list(self.scroll_stats)
+        for worker in self.workers:
+            scroll_stats.extend(worker.scroll_stats)
+        return scroll_stats
+    
+    def collect_product_tiles(self) -> List[ProductTile]:
+        # a product can show up on more than one search page, keep its first position only
+        all_tiles = []
+        collected_keys = set()
+        for current_page_tiles in self.iter_product_tiles():
+            for url, tile_text in current_page_tiles:
+                key = get_product_key(url)
+                if key in collected_keys:
+                    continue
+                collected_keys.add(key)
+                all_tiles.append((url, tile_text))
+        return all_tiles
+
+    def collect_product_urls(self) -> List[str]:
+        return [url for url, _ in self.collect_product_tiles()]
@@ -0,0 +1,42 @@
+from __future__ import annotations
+from typing import Iterable, Set
+from threading import Lock
+import os
+
+class ProductIndex:
+    # set of product keys (see product_info.get_product_key), optionally persisted one key per line
+    def __init__(self, keys: Iterable[str] = ()) -> None:
+        self.keys: Set[str] = set(keys)
+        self.lock = Lock()
+
+    def add(self, key: str) -> bool:
+        # returns False when the key was already indexed, so check-and-insert is a single step across workers
+        with self.lock:
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+            return True
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def load(cls, file_name: str) -> ProductIndex:
+        if not os.path.exists(file_name):
+            return cls()
+        with open(file_name, "r", encoding= "utf-8") as file:
+            return cls(line.strip() for line in file if line.strip())
+
+    def save(self, file_name: str) -> None:
+        with self.lock:
+            keys = sorted(self.keys)
+        temp_file_name = f"{file_name}.tmp"
+        with open(temp_file_name, "w", encoding= "utf-8") as file:
+            file.writelines(f"{key}\n" for key in keys)
+        os.replace(temp_file_name, file_name)
+
+    def __repr__(self) -> str:
+        return f"ProductIndex with {len(self.keys)} products"
@@ -1,12 +1,100 @@
 from __future__ import annotations
-from typing import Dict
+from typing import Dict, Union, Iterable, Any
+from operator import attrgetter
+from urllib.parse import urlparse
+import re
+from product_info_parser import ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME
+
+# product urls look like https://shopee.tw/<name>-i.<shop id>.<item id>?sp_atk=... or https://shopee.tw/product/<shop id>/<item id>
+PRODUCT_ID_PATTERNS = [
+    re.compile(r"-i\.(\d+)\.(\d+)"),
+    re.compile(r"/product/(\d+)/(\d+)")
+]
+
+def get_product_key(product_url: str) -> Union[None, str]:
+    if not product_url:
+        return
+    for pattern in PRODUCT_ID_PATTERNS:
+        matched = pattern.search(product_url)
+        if matched is not None:
+            shop_id, item_id = matched.groups()
+            return f"{shop_id}.{item_id}"
+    # without ids the url minus its tracking query is the most stable thing we have
+    parsed_url = urlparse(product_url)
+    return f"{parsed_url.netloc}{parsed_url.path}"
+
+# the columns every extraction backend produces, in the order to_info_dict emits them
+PRODUCT_FIELDS = tuple(ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME) + ("is_preferred_seller", "product_url")
+PRODUCT_SLOTS = frozenset(PRODUCT_FIELDS)
+
+Text = Union[None, str]
+# a parsed number, or the scraped text when parsing is left to product_info_normalizer
+Number = Union[None, str, float]
 
 class ProductInfo:
-    def __init__(self, info_dict: Dict[str, str]) -> None:
-        self.info_dict = info_dict
-    
-    def __eq__(self, __o: ProductInfo) -> bool:
-        return self.info_dict["product_name"] == __o.info_dict["product_name"]
+    # one slot per field instead of a dict per product, long crawls keep hundreds of thousands of these in memory
+    __slots__ = PRODUCT_FIELDS + ("key", "extra_fields")
+
+    product_name: Text
+    number_of_stars: Number
+    number_of_comments: Number
+    quantity_sold: Number
+    quantity_remaining: Number
+    price_range: Text
+    free_shipment_fee_threshold: Number
+    number_of_likes: Number
+    number_of_market_comments: Number
+    number_of_market_product: Number
+    chat_response_speed: Text
+    chat_response_rate: Number
+    join_time: Union[None, str, int]
+    number_of_fans: Number
+    is_preferred_seller: bool
+    product_url: Text
+    key: str
+    # fields outside the schema, from a listener with extra selectors, None for every ordinary product
+    extra_fields: Union[None, Dict[str, Any]]
+
+    def __init__(self, info_dict: Dict[str, Any]) -> None:
+        for field in PRODUCT_FIELDS:
+            setattr(self, field, info_dict.get(field))
+        extra_fields = {name: value for name, value in info_dict.items() if name not in PRODUCT_SLOTS}
+        self.extra_fields = extra_fields or None
+        self.key = get_product_key(info_dict.get("product_url")) or info_dict["product_name"]
+
+    @property
+    def info_dict(self) -> Dict[str, Any]:
+        # built on each access, callers that keep it hold a copy and the record stays compact; read it once per product
+        info_dict = {field: getattr(self, field) for field in PRODUCT_FIELDS}
+        if self.extra_fields is not None:
+            info_dict.update(self.extra_fields)
+        return info_dict
+
+    def __eq__(self, __o: object) -> bool:
+        if not isinstance(__o, ProductInfo):
+            return NotImplemented
+        return self.key == __o.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
     
     def __repr__(self) -> str:
-        return f"{self.info_dict}"
\ No newline at end of file
+        return f"{self.info_dict}"
+
+
+def to_product_frame(product_infos: Iterable[ProductInfo]):
+    # one tuple per row straight from the slots, no dict is built per product. pandas still infers every column,
+    # which is most of the time, so this is about as fast as a frame from the old dicts
+    import pandas as pd
+
+    product_infos = list(product_infos)
+    get_fields = attrgetter(*PRODUCT_FIELDS)
+    frame = pd.DataFrame.from_records([get_fields(info) for info in product_infos], columns= list(PRODUCT_FIELDS))
+    extra_field_names = []
+    for info in product_infos:
+        for name in info.extra_fields or ():
+            if name not in frame.columns and name not in extra_field_names:
+                extra_field_names.append(name)
+    for name in extra_field_names:
+        frame[name] = [(info.extra_fields or {}).get(name) for info in product_infos]
+    return frame
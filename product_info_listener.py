@@ -1,88 +1,91 @@
 from __future__ import annotations
-from typing import List ,Dict, Tuple, Union
-from threading import Thread
+from typing import List ,Dict, Tuple, Union, Callable
+from threading import Thread, Event, current_thread
 import time
 from product_info import ProductInfo
+from product_index import ProductIndex
 from driver import Driver
 from exception_decor import print_error_message
+from crawl_rate_controller import CrawlBlockedError, is_blocked_url
+from page_archive import PageArchive
+from product_info_parser import (
+    to_info_dict, 
+    ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME, 
+    NUMBER_ATTRS, 
+    DATE_ATTRS
+)
 
 
-def extract_number(number_string: str) -> float:
-    try:
-        chinese_unit = {
-            "百": 100, "千": 1000, "萬": 10000
-        }
-        temp_numbers = []
-        unit = None
-        for word in number_string:
-            if word.isdigit() or word == ".":
-                temp_numbers.append(word)
-            if word in chinese_unit:
-                unit = chinese_unit[word]
-        number = float("".join(temp_numbers))
-        if unit is None:
-            return number
-
-        return number * unit
-    except Exception as error:
-        return number_string
-
-def conver_dates(date_string: str) -> int:
-    chinese_date_unit = {
-        "月": 30, "年": 365
+# reads every configured field in a single WebDriver round trip, missing fields come back as null.
+# the text is normalized the way WebElement.text does it so both extraction paths agree.
+BATCH_EXTRACTION_SCRIPT = r"""
+const locators = arguments[0];
+const findElement = (elementType, elementName) => {
+    switch (elementType) {
+        case "css selector": return document.querySelector(elementName);
+        case "class name": return document.getElementsByClassName(elementName)[0] || null;
+        case "id": return document.getElementById(elementName);
+        case "tag name": return document.getElementsByTagName(elementName)[0] || null;
+        case "xpath": return document.evaluate(elementName, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        default: return null;
     }
-    temp_numbers = []
-    unit = None
-    for word in date_string:
-        if word.isdigit():
-            temp_numbers.append(word)
-        if word in chinese_date_unit:
-            unit = chinese_date_unit[word]
-    number = int("".join(temp_numbers))
-    
-    return number * unit
+};
+const rawTexts = {};
+for (const [itemName, elementType, elementName] of locators) {
+    const element = findElement(elementType, elementName);
+    if (element === null) {
+        rawTexts[itemName] = null;
+        continue;
+    }
+    rawTexts[itemName] = element.innerText
+        .replace(/\u00a0/g, " ")
+        .split("\n")
+        .map(line => line.replace(/[ \t]+/g, " ").trim())
+        .join("\n")
+        .trim();
+}
+return rawTexts;
+"""
 
 
 class ProductInfoListener:
     SHOPEE_URL = "https://shopee.tw/"
-    def __init__(self) -> None:
-        self.driver = Driver(is_headless= False)
+    POLL_N_SECONDS = 0.5
+    CLOSE_TIMEOUT = 10
+    # how long an open verification or login page is given to be solved by hand before the next url is opened anyway
+    BLOCKED_PAGE_TIMEOUT = 30
+    
+    def __init__(self, driver: Driver | None = None, page_ready_timeout: float = 5, is_batch_extraction: bool = True) -> None:
+        self.driver = driver or Driver(is_headless= False)
+        self.page_ready_timeout = page_ready_timeout
+        self.is_batch_extraction = is_batch_extraction
+        self.is_normalized = True
+        self.home_url = self.SHOPEE_URL
+        # when set, the rendered source of every product page scraped is kept for offline re-extraction
+        self.archive: PageArchive | None = None
         self.info_scraped:List[ProductInfo] = []
+        self.product_index = ProductIndex()
+        # when set, new products are handed over instead of piling up in info_scraped
+        self.on_product_scraped: Callable[[ProductInfo], None] | None = None
+
+        # a crawler that drives the navigation turns this off and calls scrape_current_page instead
+        self.is_navigation_watched = True
+        self.last_url_processed: str | None = None
+        self.listener_thread: Thread | None = None
+        self.stop_event = Event()
+        self.scrape_requested = Event()
+        self.scrape_done = Event()
     
-        self.item_with_element_type_and_element_name: Dict[str, Tuple(str, str)] = {
-            "product_name": ("css selector","._44qnta"),
-            "number_of_stars": ("css selector", '._046PXf'),
-            "number_of_comments": ("css selector", 'div.IZIVH\+:nth-child(2)'),
-            "quantity_sold": ("css selector", ".jgUbWJ"),
-            "quantity_remaining": ("css selector", "._6lioXX"),
-            "price_range": ("css selector", ".pqTWkA"),
-            "free_shipment_fee_threshold": ("css selector", "._7K5or9"),
-            "number_of_likes": ("css selector", "div.Ne7dEf:nth-child(2)"),
-            "number_of_market_comments": ("css selector", "div.Odudp\+:nth-child(1) > div:nth-child(1) > span:nth-child(2)"),
-            "number_of_market_product": ("css selector", ".vUG3KX"),
-            "chat_response_speed": ("css selector", "div.Odudp\+:nth-child(2) > div:nth-child(2) > span:nth-child(2)"),
-            "chat_response_rate": ("css selector", "div.Odudp\+:nth-child(2) > div:nth-child(1) > span:nth-child(2)"),
-            "join_time": ("css selector", "div.Odudp\+:nth-child(3) > div:nth-child(1)"),
-            "number_of_fans": ("css selector", "div.Odudp\+:nth-child(3) > div:nth-child(2)")
-            
-        }
-            
-        self.number_attrs = [
-            "number_of_stars", 
-            "number_of_comments", 
-            "quantity_sold", 
-            "quantity_remaining", 
-            "free_shipment_fee_threshold", 
-            "number_of_likes", 
-            "number_of_market_comments", 
-            "number_of_market_product", 
-            "chat_response_rate", 
+        self.item_with_element_type_and_element_name: Dict[str, Tuple(str, str)] = dict(ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME)
+        self.number_attrs = list(NUMBER_ATTRS)
+        self.date_attrs = list(DATE_ATTRS)
+
+        # a product page is ready once its title, price and shop section are rendered
+        self.ready_items = [
+            "product_name",
+            "price_range",
             "number_of_fans"
         ]
-        
-        self.date_attrs = [
-            "join_time"
-        ]
     
     def _is_in_product_page(self) -> bool:
         current_url = self.driver.get_current_url()
@@ -93,38 +96,67 @@ class ProductInfoListener:
         return "login" in self.driver.get_current_url()
     
     def is_in_verification_page(self) -> bool:
-        return "verify" in self.driver.get_current_url()
+        # the same test the rate controller and the search crawler use, a product name with "verify" in it is not a block
+        return is_blocked_url(self.driver.get_current_url())
+
+    def is_blocked(self) -> bool:
+        # is_blocked_url covers the login redirects as well
+        return self.is_in_verification_page()
+
+    def wait_while_blocked(self) -> ProductInfoListener:
+        # call it outside of a rate controller request, up to BLOCKED_PAGE_TIMEOUT here is not a slow response of the next url
+        if self.is_blocked():
+            with self.driver.stage("blocked"):
+                self.driver.wait_until_ready(self.BLOCKED_PAGE_TIMEOUT, lambda _: not self.is_blocked(), label= "blocked")
+        return self
         
     def _go_to_shopee_official_website(self) -> ProductInfoListener:
-        self.driver.open_firefox_browser().open_url(self.SHOPEE_URL).wait_n_seconds(3)
+        with self.driver.stage("home"):
+            self.driver.open_firefox_browser().open_url(self.home_url).wait_until_document_loaded(3, label= "home")
         
         return self
 
+    def _get_raw_texts_one_by_one(self) -> Dict[str, Union[None, str]]:
+        raw_texts = {}
+        for item_name, element_type_and_element_name in self.item_with_element_type_and_element_name.items():
+            element_type, element_name = element_type_and_element_name
+            if not self.driver.is_element_exists_by(element_type, element_name):
+                raw_texts[item_name] = None
+                continue
+            raw_texts[item_name] = self.driver.find_element_by(element_type, element_name).searched_element.text
+        return raw_texts
+
+    def _get_raw_texts_in_batch(self) -> Dict[str, Union[None, str]]:
+        locators = [
+            [item_name, element_type, element_name] 
+            for item_name, (element_type, element_name) in self.item_with_element_type_and_element_name.items()
+        ]
+        return self.driver.execute_script_and_get_result(BATCH_EXTRACTION_SCRIPT, locators)
+
+    def _to_info_dict(self, raw_texts: Dict[str, Union[None, str]]) -> Dict[str, str]:
+        return to_info_dict(
+            raw_texts, 
+            self.driver.get_current_url(), 
+            self.item_with_element_type_and_element_name, 
+            self.number_attrs, 
+            self.date_attrs,
+            self.is_normalized
+        )
+
     @print_error_message
     def _get_product_info_dict(self) -> Union[None, Dict[str, str]]:
         if not self._is_in_product_page():
             return
 
         try:
-            info_dict = {}
-            for item_name, element_type_and_element_name in self.item_with_element_type_and_element_name.items():
-                element_type, element_name = element_type_and_element_name
-                if not self.driver.is_element_exists_by(element_type, element_name):
-                    print(f"[{element_type}] {element_name} for {item_name} is not exists.")
-                    info_dict[item_name] = None
-                    continue
-                text = self.driver.find_element_by(element_type, element_name).searched_element.text
-                if item_name in self.number_attrs:
-                    info_dict[item_name] = extract_number(text)
-                elif item_name in self.date_attrs:
-                    info_dict[item_name] = conver_dates(text)
-                else:
-                    info_dict[item_name] = text
-
-            info_dict["is_preferred_seller"] = True if "優選" in info_dict["product_name"] else False
-            info_dict["product_url"] = self.driver.get_current_url()
+            if self.archive is not None:
+                self.archive.archive(self.driver.get_current_url(), self.driver.get_page_source(), "product")
+            if self.is_batch_extraction:
+                raw_texts = self._get_raw_texts_in_batch()
+            else:
+                raw_texts = self._get_raw_texts_one_by_one()
         
-            return info_dict
+            return self._to_info_dict(raw_texts)
         except Exception as error:
             print(error)
             return
@@ -132,30 +164,90 @@ class ProductInfoListener:
     def go_to_product_url(self, url: str) -> None:
         self.driver.open_url(url)
 
+    def wait_until_product_page_ready(self) -> ProductInfoListener:
+        locators = [self.item_with_element_type_and_element_name[item_name] for item_name in self.ready_items]
+        self.driver.wait_until_all_present(self.page_ready_timeout, locators, fixed_wait_n_seconds= 5, label= "product")
+        return self
+
+    def open_browser(self) -> ProductInfoListener:
+        return self._go_to_shopee_official_website()
+
+    def scrape_product_url(self, url: str) -> Union[None, ProductInfo]:
+        # the caller waits out a verification page left by the previous url, see wait_while_blocked
+        with self.driver.stage("product"):
+            self.go_to_product_url(url)
+            self.wait_until_product_page_ready()
+            if self.is_blocked():
+                raise CrawlBlockedError(self.driver.get_current_url())
+
+            info_dict = self._get_product_info_dict()
+        if info_dict is None:
+            return
+
+        return ProductInfo(info_dict)
     
-    def listen(self) -> Dict[str, str]:
+    def _handle_product_info_dict(self, info_dict: Dict[str, str]) -> None:
+        product_info = ProductInfo(info_dict)
+        if not self.product_index.add(product_info.key):
+            return
+        print(product_info)
+        if self.on_product_scraped is None:
+            self.info_scraped.append(product_info)
+        else:
+            self.on_product_scraped(product_info)
+
+    def scrape_current_page(self, max_wait_n_seconds: float = 10) -> None:
+        # called by whoever drove the navigation once the page is ready, returns when the listener has scraped it
+        self.scrape_done.clear()
+        self.scrape_requested.set()
+        self.scrape_done.wait(max_wait_n_seconds)
+    
+    def listen(self) -> None:
         try:
-            self._go_to_shopee_official_website()
-            while (True):
+            if self.driver.driver is None:
+                self._go_to_shopee_official_website()
+            while not self.stop_event.is_set():
+                is_scrape_requested = self.scrape_requested.wait(self.POLL_N_SECONDS)
+                self.scrape_requested.clear()
+                if self.stop_event.is_set():
+                    break
+
+                # a page is scraped once when it is navigated to, or again when the crawler asks for it
+                if not is_scrape_requested and not self.is_navigation_watched:
+                    continue
+                current_url = self.driver.get_current_url()
+                if current_url == self.last_url_processed and not is_scrape_requested:
+                    continue
                 if not self._is_in_product_page():
-                    time.sleep(0.5)
+                    self.scrape_done.set()
                     continue
 
-                info_dict = self._get_product_info_dict()
-                if info_dict is None:
-                    continue
-                
-                product_info = ProductInfo(info_dict)
-                if product_info not in self.info_scraped:
-                    print(product_info)
-                    self.info_scraped.append(product_info)
+                with self.driver.stage("product"):
+                    info_dict = self._get_product_info_dict()
+                # a page we navigated to by hand may still be rendering, it is retried on the next poll
+                if info_dict is not None or is_scrape_requested:
+                    self.last_url_processed = current_url
+                if info_dict is not None:
+                    self._handle_product_info_dict(info_dict)
+                self.scrape_done.set()
         except KeyboardInterrupt:
             self.driver.close_browser()
-            
-        
+        except Exception as error:
+            if not self.stop_event.is_set():
+                print(f"Listener stopped: {error}")
+        finally:
+            self.scrape_done.set()
     
     def run(self) -> None:
-        Thread(target= self.listen).start()
+        self.stop_event.clear()
+        self._go_to_shopee_official_website()
+        self.listener_thread = Thread(target= self.listen, daemon= True)
+        self.listener_thread.start()
         
     def close(self) -> None:
-        self.driver.close_browser()
\ No newline at end of file
+        self.stop_event.set()
+        self.scrape_requested.set()
+        if self.listener_thread is not None and self.listener_thread is not current_thread():
+            self.listener_thread.join(self.CLOSE_TIMEOUT)
+        self.listener_thread = None
+        self.driver.close_browser()
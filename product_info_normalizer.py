@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import Dict, Tuple
+import pandas as pd
+from product_info_parser import NUMBER_ATTRS, DATE_ATTRS
+
+# whole-column counterparts of extract_number / conver_dates, they accept raw texts as well as already parsed values
+CHINESE_UNITS = {"百": 100, "千": 1000, "萬": 10000}
+CHINESE_DATE_UNITS = {"月": 30, "年": 365}
+
+# counts are whole numbers once the unit is applied, ratings, rates and prices keep their fraction
+FLOAT_ATTRS = [
+    "number_of_stars",
+    "free_shipment_fee_threshold",
+    "chat_response_rate"
+]
+CATEGORY_ATTRS = [
+    "chat_response_speed"
+]
+INT32_MAX = 2 ** 31 - 1
+
+
+def _split_number_and_unit(column: pd.Series, units: Dict[str, int], number_pattern: str) -> Tuple[pd.Series, pd.Series]:
+    texts = column.astype("string")
+    numbers = pd.to_numeric(texts.str.replace(number_pattern, "", regex= True), errors= "coerce")
+    # like the per-field parsers, the last unit character in the text wins
+    unit_characters = "".join(units)
+    multipliers = texts.str.extract(f"([{unit_characters}])[^{unit_characters}]*$", expand= False).map(units)
+    return numbers, multipliers
+
+
+def parse_number_column(column: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype("float64")
+    numbers, multipliers = _split_number_and_unit(column, CHINESE_UNITS, r"[^\d.]")
+    return numbers * multipliers.fillna(1).astype("float64")
+
+
+def parse_date_column(column: pd.Series) -> pd.Series:
+    # a numeric column was already converted to days by conver_dates
+    if pd.api.types.is_numeric_dtype(column):
+        return column.astype("float64")
+    numbers, multipliers = _split_number_and_unit(column, CHINESE_DATE_UNITS, r"[^\d]")
+    return numbers * multipliers.astype("float64")
+
+
+def to_whole_number_column(numbers: pd.Series) -> pd.Series:
+    # Int32 halves the memory of a count column, a column with any value outside its range (e.g. 999999萬) stays Int64
+    numbers = numbers.round()
+    if numbers.abs().max() > INT32_MAX:
+        return numbers.astype("Int64")
+    return numbers.astype("Int32")
+
+
+def normalize_product_frame(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for column_name in NUMBER_ATTRS:
+        if column_name not in df:
+            continue
+        numbers = parse_number_column(df[column_name])
+        if column_name in FLOAT_ATTRS:
+            df[column_name] = numbers.astype("float32")
+        else:
+            df[column_name] = to_whole_number_column(numbers)
+
+    for column_name in DATE_ATTRS:
+        if column_name in df:
+            df[column_name] = to_whole_number_column(parse_date_column(df[column_name]))
+
+    for column_name in CATEGORY_ATTRS:
+        if column_name in df:
+            df[column_name] = df[column_name].astype("category")
+
+    if "is_preferred_seller" in df:
+        df["is_preferred_seller"] = df["is_preferred_seller"].astype("boolean")
+    return df
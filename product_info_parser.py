@@ -0,0 +1,105 @@
+from __future__ import annotations
+from typing import List, Dict, Tuple, Union
+
+# selector table and text normalization shared by every extraction backend (browser, http, archive replay)
+
+ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME: Dict[str, Tuple[str, str]] = {
+    "product_name": ("css selector","._44qnta"),
+    "number_of_stars": ("css selector", '._046PXf'),
+    "number_of_comments": ("css selector", 'div.IZIVH\+:nth-child(2)'),
+    "quantity_sold": ("css selector", ".jgUbWJ"),
+    "quantity_remaining": ("css selector", "._6lioXX"),
+    "price_range": ("css selector", ".pqTWkA"),
+    "free_shipment_fee_threshold": ("css selector", "._7K5or9"),
+    "number_of_likes": ("css selector", "div.Ne7dEf:nth-child(2)"),
+    "number_of_market_comments": ("css selector", "div.Odudp\+:nth-child(1) > div:nth-child(1) > span:nth-child(2)"),
+    "number_of_market_product": ("css selector", ".vUG3KX"),
+    "chat_response_speed": ("css selector", "div.Odudp\+:nth-child(2) > div:nth-child(2) > span:nth-child(2)"),
+    "chat_response_rate": ("css selector", "div.Odudp\+:nth-child(2) > div:nth-child(1) > span:nth-child(2)"),
+    "join_time": ("css selector", "div.Odudp\+:nth-child(3) > div:nth-child(1)"),
+    "number_of_fans": ("css selector", "div.Odudp\+:nth-child(3) > div:nth-child(2)")
+
+}
+
+NUMBER_ATTRS = [
+    "number_of_stars", 
+    "number_of_comments", 
+    "quantity_sold", 
+    "quantity_remaining", 
+    "free_shipment_fee_threshold", 
+    "number_of_likes", 
+    "number_of_market_comments", 
+    "number_of_market_product", 
+    "chat_response_rate", 
+    "number_of_fans"
+]
+
+DATE_ATTRS = [
+    "join_time"
+]
+
+
+def extract_number(number_string: str) -> float:
+    try:
+        chinese_unit = {
+            "百": 100, "千": 1000, "萬": 10000
+        }
+        temp_numbers = []
+        unit = None
+        for word in number_string:
+            if word.isdigit() or word == ".":
+                temp_numbers.append(word)
+            if word in chinese_unit:
+                unit = chinese_unit[word]
+        number = float("".join(temp_numbers))
+        if unit is None:
+            return number
+
+        return number * unit
+    except Exception as error:
+        return number_string
+
+def conver_dates(date_string: str) -> int:
+    chinese_date_unit = {
+        "月": 30, "年": 365
+    }
+    temp_numbers = []
+    unit = None
+    for word in date_string:
+        if word.isdigit():
+            temp_numbers.append(word)
+        if word in chinese_date_unit:
+            unit = chinese_date_unit[word]
+    number = int("".join(temp_numbers))
+    
+    return number * unit
+
+
+def to_info_dict(
+    raw_texts: Dict[str, Union[None, str]], 
+    product_url: str, 
+    item_with_element_type_and_element_name: Dict[str, Tuple[str, str]] = ITEM_WITH_ELEMENT_TYPE_AND_ELEMENT_NAME, 
+    number_attrs: List[str] = NUMBER_ATTRS, 
+    date_attrs: List[str] = DATE_ATTRS,
+    is_normalized: bool = True
+) -> Dict[str, str]:
+    # with is_normalized off the raw texts are kept, product_info_normalizer parses them column by column afterwards
+    info_dict = {}
+    for item_name, (element_type, element_name) in item_with_element_type_and_element_name.items():
+        text = raw_texts.get(item_name)
+        if text is None:
+            print(f"[{element_type}] {element_name} for {item_name} is not exists.")
+            info_dict[item_name] = None
+            continue
+        if not is_normalized:
+            info_dict[item_name] = text
+        elif item_name in number_attrs:
+            info_dict[item_name] = extract_number(text)
+        elif item_name in date_attrs:
+            info_dict[item_name] = conver_dates(text)
+        else:
+            info_dict[item_name] = text
+
+    info_dict["is_preferred_seller"] = True if "優選" in info_dict["product_name"] else False
+    info_dict["product_url"] = product_url
+    return info_dict
@@ -0,0 +1,87 @@
+from __future__ import annotations
+from typing import Dict, Any
+from threading import Lock
+import hashlib
+import json
+import os
+import re
+import time
+
+Snapshot = Dict[str, Any]
+DEFAULT_SNAPSHOT_TTL_N_SECONDS = 7 * 24 * 60 * 60
+
+# a tile is only considered changed when its prices or its sold count do, ad badges and promo labels come and go.
+# tiles read like "...\n$1,280 - $1,580\n已售出 1.2萬", a crossed out price before a discount counts as a price as well
+TILE_PRICE_PATTERN = re.compile(r"\$\s*(\d[\d,]*(?:\.\d+)?)")
+TILE_SOLD_PATTERN = re.compile(r"已售出?\s*(\d[\d,.]*\s*[萬千]?)|(\d[\d,.]*\s*[kK萬千]?)\s*sold")
+
+
+def get_tile_fingerprint(tile_text: str) -> str:
+    prices = [price.replace(",", "") for price in TILE_PRICE_PATTERN.findall(tile_text)]
+    sold = TILE_SOLD_PATTERN.search(tile_text)
+    sold_text = "" if sold is None else "".join((sold.group(1) or sold.group(2)).split())
+    if len(prices) == 0 and sold_text == "":
+        # a tile layout without either, the whole text is the only change signal left; innerText and lxml differ in whitespace only
+        signal = "".join(tile_text.split())
+    else:
+        signal = f"{','.join(prices)}|{sold_text}"
+    return hashlib.sha1(signal.encode("utf-8")).hexdigest()[:16]
+
+
+class ProductSnapshotStore:
+    # the last scrape of every product keyed like ProductIndex, with the fingerprint of the search tile it was queued from.
+    # a product page is worth opening again only when the product is new, its tile changed or the snapshot is older than the ttl.
+    def __init__(self, snapshots: Dict[str, Snapshot] | None = None, ttl_n_seconds: float = DEFAULT_SNAPSHOT_TTL_N_SECONDS) -> None:
+        self.snapshots: Dict[str, Snapshot] = snapshots or {}
+        self.ttl_n_seconds = ttl_n_seconds
+        self.lock = Lock()
+
+    def get_recrawl_reason(self, key: str, fingerprint: str, now: float | None = None) -> str | None:
+        # None when the snapshot is still good
+        snapshot = self.snapshots.get(key)
+        if snapshot is None:
+            return "new"
+        if snapshot["fingerprint"] != fingerprint:
+            return "changed"
+        if (now or time.time()) - snapshot["scraped_at"] > self.ttl_n_seconds:
+            return "expired"
+        return
+
+    def update(self, key: str, fingerprint: str, info_dict: Dict[str, Any], scraped_at: float | None = None) -> None:
+        with self.lock:
+            self.snapshots[key] = {"fingerprint": fingerprint, "scraped_at": scraped_at or time.time(), "info_dict": info_dict}
+
+    def get_info_dict(self, key: str) -> Dict[str, Any] | None:
+        with self.lock:
+            snapshot = self.snapshots.get(key)
+        return None if snapshot is None else snapshot["info_dict"]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.snapshots
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    @classmethod
+    def load(cls, file_name: str, ttl_n_seconds: float = DEFAULT_SNAPSHOT_TTL_N_SECONDS) -> ProductSnapshotStore:
+        if not os.path.exists(file_name):
+            return cls(ttl_n_seconds= ttl_n_seconds)
+        snapshots = {}
+        with open(file_name, "r", encoding= "utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                snapshots[record.pop("key")] = record
+        return cls(snapshots, ttl_n_seconds)
+
+    def save(self, file_name: str) -> None:
+        with self.lock:
+            records = [{"key": key, **snapshot} for key, snapshot in self.snapshots.items()]
+        temp_file_name = f"{file_name}.tmp"
+        with open(temp_file_name, "w", encoding= "utf-8") as file:
+            file.writelines(json.dumps(record, ensure_ascii= False, default= str) + "\n" for record in records)
+        os.replace(temp_file_name, file_name)
+
+    def __repr__(self) -> str:
+        return f"ProductSnapshotStore with {len(self.snapshots)} products, ttl {self.ttl_n_seconds}s"
@@ -0,0 +1,81 @@
+from __future__ import annotations
+from typing import List, Dict, Any
+import argparse
+import os
+import time
+from http_fetcher import parse_product_info_dict, parse_search_page_urls
+from page_archive import PageArchive, ArchiveEntry
+from result_sink import create_sink
+from thread import StreamingExecutor
+
+# re-runs extraction over archived pages with the selectors currently in product_info_parser, no browser and no network
+
+
+def extract_rows(archive_directory: str, entries: List[ArchiveEntry], is_normalized: bool = True) -> List[Dict[str, Any]]:
+    # one task per chunk of pages, a task per page would spend more on pickling than on parsing
+    archive = PageArchive(archive_directory)
+    rows = []
+    for entry in entries:
+        try:
+            page_source = archive.read(entry["digest"])
+        except OSError as error:
+            print(f"Missing archived page for {entry['url']}: {error}")
+            continue
+        if entry["kind"] == "product":
+            info_dict = parse_product_info_dict(page_source, entry["url"], is_normalized)
+            if info_dict is not None:
+                rows.append({**info_dict, "archived_at": entry["archived_at"]})
+            continue
+        for position, product_url in enumerate(parse_search_page_urls(page_source, entry["url"]) or []):
+            rows.append({"query_url": entry["url"], "position": position, "product_url": product_url, "archived_at": entry["archived_at"]})
+    return rows
+
+
+def replay_archive(
+    archive_directory: str,
+    output_file_name: str,
+    kind: str = "product",
+    number_of_workers: int | None = None,
+    chunk_size: int = 200,
+    is_latest_only: bool = True,
+    is_normalized: bool = True
+) -> Dict[str, Any]:
+    entries = PageArchive(archive_directory).get_entries(kind, is_latest_only)
+    chunks = [entries[start:start + chunk_size] for start in range(0, len(entries), chunk_size)]
+    executor = StreamingExecutor(extract_rows, number_of_workers or os.cpu_count() or 1, backend= "process")
+
+    start = time.perf_counter()
+    with create_sink(output_file_name, flush_size= 1000) as sink:
+        for task_result in executor.stream(
+            {"archive_directory": archive_directory, "entries": chunk, "is_normalized": is_normalized} for chunk in chunks
+        ):
+            if not task_result.is_success:
+                print(f"Failed to replay chunk #{task_result.index}: {task_result.error}")
+                continue
+            for row in task_result.result:
+                sink.write(row)
+    elapsed_n_seconds = time.perf_counter() - start
+
+    return {
+        "kind": kind,
+        "number_of_pages": len(entries),
+        "number_of_rows": sink.number_of_rows_written,
+        "elapsed_n_seconds": round(elapsed_n_seconds, 3),
+        "pages_per_second": round(len(entries) / elapsed_n_seconds, 1) if elapsed_n_seconds > 0 else 0.0
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description= "Re-extract products or search results from an archive of crawled pages.")
+    parser.add_argument("archive_directory")
+    parser.add_argument("output", help= "output file, .csv, .jsonl, .parquet or .feather")
+    parser.add_argument("--kind", default= "product", choices= list(PageArchive.PAGE_KINDS))
+    parser.add_argument("--workers", type= int, help= "worker processes, one per core by default")
+    parser.add_argument("--chunk-size", type= int, default= 200)
+    parser.add_argument("--all-versions", action= "store_true", help= "replay every archived visit instead of the latest per url")
+    parser.add_argument("--raw", action= "store_true", help= "keep the scraped texts instead of parsing numbers and dates")
+    args = parser.parse_args()
+    print(replay_archive(
+        args.archive_directory, args.output, args.kind, args.workers, args.chunk_size,
+        is_latest_only= not args.all_versions, is_normalized= not args.raw
+    ))
@@ -0,0 +1,183 @@
+from __future__ import annotations
+from typing import List, Dict, Any
+from abc import ABC, abstractmethod
+from threading import Lock
+import csv
+import json
+import os
+
+Row = Dict[str, Any]
+
+class ResultSink(ABC):
+    # buffers rows and writes them out every `flush_size` rows, so a crash loses at most one batch
+    def __init__(self, file_name: str, flush_size: int = 100) -> None:
+        self.file_name = file_name
+        self.flush_size = max(1, flush_size)
+        self.rows: List[Row] = []
+        self.number_of_rows_written = 0
+        self.lock = Lock()
+
+    def write(self, row: Row) -> None:
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= self.flush_size:
+                self._flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if len(self.rows) == 0:
+            return
+        self._write_rows(self.rows)
+        self.number_of_rows_written += len(self.rows)
+        self.rows = []
+
+    def close(self) -> None:
+        with self.lock:
+            self._flush()
+            self._close()
+
+    @abstractmethod
+    def _write_rows(self, rows: List[Row]) -> None:
+        pass
+
+    def _close(self) -> None:
+        pass
+
+    def __enter__(self) -> ResultSink:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.file_name}), {self.number_of_rows_written} rows written"
+
+
+class CsvSink(ResultSink):
+    def __init__(self, file_name: str, flush_size: int = 100) -> None:
+        super().__init__(file_name, flush_size)
+        self.file = None
+        self.writer = None
+
+    def _write_rows(self, rows: List[Row]) -> None:
+        if self.writer is None:
+            self.file = open(self.file_name, "w", newline= "", encoding= "utf_8_sig")
+            # the first batch fixes the header, later columns that were never seen are dropped
+            self.writer = csv.DictWriter(self.file, fieldnames= list(rows[0].keys()), extrasaction= "ignore")
+            self.writer.writeheader()
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def _close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+class JsonlSink(ResultSink):
+    def __init__(self, file_name: str, flush_size: int = 100) -> None:
+        super().__init__(file_name, flush_size)
+        self.file = None
+
+    def _write_rows(self, rows: List[Row]) -> None:
+        # opened on the first batch like every other sink, a crawl that scraped nothing leaves no file behind
+        if self.file is None:
+            self.file = open(self.file_name, "w", encoding= "utf-8")
+        self.file.writelines(f"{json.dumps(row, ensure_ascii= False, default= str)}\n" for row in rows)
+        self.file.flush()
+
+    def _close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+
+class ArrowSink(ResultSink):
+    # each flush becomes one parquet row group / one feather record batch under the schema of the first batch
+    def __init__(self, file_name: str, flush_size: int = 100) -> None:
+        super().__init__(file_name, flush_size)
+        try:
+            import pyarrow
+        except ImportError as error:
+            raise ImportError(f"{self.__class__.__name__} requires pyarrow, install it with `pip install pyarrow`") from error
+        self.pa = pyarrow
+        self.schema = None
+        self.writer = None
+
+    def _infer_schema(self, rows: List[Row]):
+        fields = []
+        for column in rows[0].keys():
+            try:
+                data_type = self.pa.array([row.get(column) for row in rows]).type
+            except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+                data_type = self.pa.string()
+            if self.pa.types.is_null(data_type):
+                data_type = self.pa.string()
+            fields.append(self.pa.field(column, data_type))
+        return self.pa.schema(fields)
+
+    def _coerce(self, value: Any, data_type) -> Any:
+        # a raw string left by a failed number parse must not break the column type of the whole file
+        if value is None:
+            return None
+        try:
+            if self.pa.types.is_string(data_type):
+                return str(value)
+            if self.pa.types.is_floating(data_type):
+                return float(value)
+            if self.pa.types.is_integer(data_type):
+                return int(value)
+            if self.pa.types.is_boolean(data_type):
+                return bool(value)
+        except (TypeError, ValueError):
+            return None
+        return value
+
+    def _to_table(self, rows: List[Row]):
+        return self.pa.Table.from_pydict(
+            {
+                field.name: [self._coerce(row.get(field.name), field.type) for row in rows]
+                for field in self.schema
+            },
+            schema= self.schema
+        )
+
+    def _write_rows(self, rows: List[Row]) -> None:
+        if self.schema is None:
+            self.schema = self._infer_schema(rows)
+            self.writer = self._open_writer()
+        self.writer.write_table(self._to_table(rows))
+
+    @abstractmethod
+    def _open_writer(self):
+        pass
+
+    def _close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ParquetSink(ArrowSink):
+    def _open_writer(self):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(self.file_name, self.schema)
+
+
+class FeatherSink(ArrowSink):
+    def _open_writer(self):
+        # feather v2 is the arrow ipc file format, which can be written batch by batch
+        return self.pa.ipc.new_file(self.file_name, self.schema)
+
+
+SINKS_BY_EXTENSION = {
+    ".csv": CsvSink,
+    ".jsonl": JsonlSink,
+    ".parquet": ParquetSink,
+    ".feather": FeatherSink
+}
+
+def create_sink(file_name: str, flush_size: int = 100) -> ResultSink:
+    extension = os.path.splitext(file_name)[1].lower()
+    assert extension in SINKS_BY_EXTENSION, f"{extension} is not one of {list(SINKS_BY_EXTENSION)}"
+    return SINKS_BY_EXTENSION[extension](file_name, flush_size)
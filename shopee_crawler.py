@@ -1,39 +1,431 @@
-from typing import List, Dict
-import time
+from __future__ import annotations
+from typing import List, Dict, Callable, Iterable, Iterator, Any, TYPE_CHECKING
+from itertools import chain
+from queue import Queue, Empty, Full
+from threading import Thread as BackgroundThread, Lock, Event
 import uuid
-import pandas as pd
-from product_address_crawler import ProductAddressCrawler
+from product_address_crawler import ProductAddressCrawler, summarize_scroll_stats
 from product_info_listener import ProductInfoListener
+from product_info import ProductInfo, get_product_key, to_product_frame
+from product_index import ProductIndex
+from driver import Driver, summarize_wait_records
+from driver_pool import DriverPool
+from driver_metrics import DriverMetrics
+from crawl_rate_controller import CrawlRateController, CrawlBlockedError
+from page_archive import PageArchive
+from product_snapshot_store import ProductSnapshotStore, get_tile_fingerprint, DEFAULT_SNAPSHOT_TTL_N_SECONDS
+from http_fetcher import HttpFetcher, ProductTile
+from result_sink import ResultSink, CsvSink
+from thread import StreamingExecutor
+
+# pandas is only imported by the collect_info_into_df* methods, sink-only and batch runs never load it
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def warm_up_browser(driver: Driver, base_url: str) -> None:
+    with driver.stage("home"):
+        driver.open_url(base_url).wait_until_document_loaded(3, label= "home")
+
+
+def create_driver_pool(
+    size: int,
+    browser_profile: str = "default",
+    base_url: str = ProductInfoListener.SHOPEE_URL,
+    metrics: DriverMetrics | None = None,
+    max_pages_per_browser: int = 200,
+    max_browser_memory_mb: float | None = None,
+    is_warmed_up: bool = True
+) -> DriverPool:
+    return DriverPool(
+        size,
+        lambda: Driver(is_headless= False, profile= browser_profile, metrics= metrics),
+        (lambda driver: warm_up_browser(driver, base_url)) if is_warmed_up else None,
+        max_pages_per_browser,
+        max_browser_memory_mb
+    )
+
 
 class ShopeeCrawler:
-    def __init__(self, keyword: str, number_of_pages: int | None = None) -> None:
-        self.listener_browser = ProductInfoListener()
-        self.address_scraper = ProductAddressCrawler(keyword, number_of_pages)
+    FETCH_ENGINES = ("browser", "http")
+    # how often the url producer and consumer check whether the other side has stopped
+    QUEUE_POLL_N_SECONDS = 0.5
+
+    def __init__(
+        self,
+        keyword: str,
+        number_of_pages: int | None = None,
+        number_of_workers: int = 1,
+        page_ready_timeout: float = 5,
+        fetch_engine: str = "browser",
+        seen_products_file: str | None = None,
+        flush_size: int = 100,
+        queue_size: int = 100,
+        number_of_search_workers: int = 1,
+        browser_profile: str = "default",
+        max_pages_per_browser: int = 200,
+        max_browser_memory_mb: float | None = None,
+        is_normalized_after_scrape: bool = False,
+        base_url: str = ProductInfoListener.SHOPEE_URL,
+        metrics: DriverMetrics | None = None,
+        metrics_file: str | None = None,
+        metrics_flush_n_seconds: float = 30,
+        task_timeout_n_seconds: float | None = None,
+        max_task_retries: int = 2,
+        max_requests_per_second: float = 5.0,
+        rate_controller: CrawlRateController | None = None,
+        archive_dir: str | None = None,
+        snapshot_file: str | None = None,
+        snapshot_ttl_n_seconds: float = DEFAULT_SNAPSHOT_TTL_N_SECONDS,
+        driver_pool: DriverPool | None = None,
+        search_driver_pool: DriverPool | None = None,
+        product_index: ProductIndex | None = None,
+        fetcher: HttpFetcher | None = None
+    ) -> None:
+        assert fetch_engine in self.FETCH_ENGINES, f"{fetch_engine} is not one of {self.FETCH_ENGINES}"
+
+        self.number_of_workers = max(1, number_of_workers)
+        # the http engine goes through a pooled session first and only opens a browser for pages that need javascript.
+        # a fetcher, driver pool or product index passed in is shared with other crawlers and left open by close()
+        self.is_fetcher_owned = fetcher is None
+        if fetcher is None and fetch_engine == "http":
+            fetcher = HttpFetcher(pool_size= self.number_of_workers + number_of_search_workers)
+        self.fetcher = fetcher
+        # every page source the crawl extracts from is archived, replay_archive.py re-extracts from it without crawling again
+        self.archive = PageArchive(archive_dir) if archive_dir is not None else None
+        if self.fetcher is not None:
+            self.fetcher.archive = self.archive
+        self.browser_profile = browser_profile
+        self.base_url = base_url
+        # verification and login redirects slow every stage down, clean responses speed it back up towards the limits
+        self.rate_controller = rate_controller or CrawlRateController(self.number_of_workers, max_requests_per_second= max_requests_per_second)
+        # a metrics file turns the driver instrumentation on, the report is rewritten while the crawl runs and once at the end
+        self.metrics = DriverMetrics() if metrics is None and metrics_file is not None else metrics
+        self.metrics_file = metrics_file
+        self.metrics_flush_n_seconds = metrics_flush_n_seconds
+        self.listener_browser = ProductInfoListener(Driver(is_headless= False, profile= browser_profile, metrics= self.metrics), page_ready_timeout)
+        self.listener_browser.home_url = base_url
+        self.listener_browser.archive = self.archive
+        self.address_scraper = ProductAddressCrawler(
+            keyword,
+            number_of_pages,
+            self.fetcher,
+            number_of_search_workers,
+            browser_profile,
+            base_url,
+            self.metrics,
+            self.rate_controller,
+            self.archive,
+            search_driver_pool
+        )
+        self.page_ready_timeout = page_ready_timeout
+        self.fetch_engine = fetch_engine
+        # product workers share warm browser sessions instead of each cold-starting its own firefox
+        self.is_driver_pool_owned = driver_pool is None
+        if driver_pool is None:
+            driver_pool = create_driver_pool(self.number_of_workers, browser_profile, base_url, self.metrics, max_pages_per_browser, max_browser_memory_mb)
+        self.driver_pool = driver_pool
+        # one listener per pooled browser, built the first time that browser scrapes a product and dropped when the pool retires it
+        self.browser_listeners: Dict[Driver, ProductInfoListener] = {}
+        self.browser_listeners_lock = Lock()
+        # products from earlier runs are skipped before their page is ever opened
+        self.seen_products_file = seen_products_file
+        # an index passed in is shared with other crawlers on purpose, it is never reset here
+        self.is_product_index_owned = product_index is None
+        self._set_product_index(self._load_product_index() if product_index is None else product_index)
+        # incremental mode: a product whose search tile still reads the same and whose snapshot is fresh is not opened again
+        self.snapshot_file = snapshot_file
+        self.snapshot_store = None if snapshot_file is None else ProductSnapshotStore.load(snapshot_file, snapshot_ttl_n_seconds)
+        self.tile_fingerprints: Dict[str, str] = {}
+        self.recrawl_reasons: Dict[str, int] = {}
+        self.listener_browser.on_product_scraped = self._handle_product_info
+        self.listener_browser.is_navigation_watched = False
+        # skips the per-field parsing while scraping, only for collect_info_into_df* whose frame is normalized column by column.
+        # the backup csv and snapshots of such a run keep the raw texts; sink runs and single urls always parse while
+        # scraping, so every row that leaves the crawler through a sink has one schema
+        self.is_normalized_after_scrape = is_normalized_after_scrape
+        self.is_normalized_at_scrape = True
+
+        self.flush_size = flush_size
+        self.queue_size = queue_size
+        # every product url is one task, a failed or stuck one is retried on its own without holding up the others
+        self.task_timeout_n_seconds = task_timeout_n_seconds
+        self.max_task_retries = max_task_retries
+        self.sink: ResultSink | None = None
+        self.is_kept_in_memory = True
+        self.info_scraped: List[ProductInfo] = []
     
-    def collect_info_into_df(self) -> pd.core.frame.DataFrame:
-        random_file_name = uuid.uuid4()
-        
+    def _is_recrawled(self, key: str, tile_text: str) -> bool:
+        if self.snapshot_store is None:
+            return True
+        fingerprint = get_tile_fingerprint(tile_text)
+        reason = self.snapshot_store.get_recrawl_reason(key, fingerprint) or "unchanged"
+        self.recrawl_reasons[reason] = self.recrawl_reasons.get(reason, 0) + 1
+        if reason == "unchanged":
+            self._handle_unchanged_product(key)
+            return False
+        self.tile_fingerprints[key] = fingerprint
+        return True
+
+    def _iter_unseen_product_urls(self, tiles: Iterable[ProductTile]) -> Iterator[str]:
+        queued_keys = set()
+        for url, tile_text in tiles:
+            key = get_product_key(url)
+            if key in self.product_index or key in queued_keys:
+                continue
+            queued_keys.add(key)
+            if not self._is_recrawled(key, tile_text):
+                continue
+            yield url
+
+    def _get_unseen_product_urls(self, tiles: List[ProductTile]) -> List[str]:
+        unseen_product_urls = list(self._iter_unseen_product_urls(tiles))
+        print(f"{len(tiles) - len(unseen_product_urls)} of {len(tiles)} product urls are duplicated, already scraped or unchanged.")
+        return unseen_product_urls
+
+    def _load_product_index(self) -> ProductIndex:
+        return ProductIndex() if self.seen_products_file is None else ProductIndex.load(self.seen_products_file)
+
+    def _set_product_index(self, product_index: ProductIndex) -> None:
+        self.product_index = product_index
+        self.listener_browser.product_index = product_index
+
+    def _save_product_index(self) -> None:
+        if self.seen_products_file is None:
+            return
+        self.product_index.save(self.seen_products_file)
+
+    def _save_snapshots(self) -> None:
+        if self.snapshot_store is None:
+            return
+        self.snapshot_store.save(self.snapshot_file)
+
+    def _fetch_product_info(self, url: str) -> ProductInfo | None:
+        if self.fetcher is None:
+            return
+        self.fetcher.is_normalized = self.is_normalized_at_scrape
+        info_dict = self.fetcher.fetch_product_info_dict(url)
+        if info_dict is None:
+            return
+        return ProductInfo(info_dict)
+
+    def _handle_unchanged_product(self, key: str) -> None:
+        # the last scrape stands in for a page that was not opened, so an incremental run outputs every product a full one would
+        info_dict = self.snapshot_store.get_info_dict(key)
+        if info_dict is None or not self.product_index.add(key):
+            return
+        self._handle_product_info(ProductInfo(info_dict))
+
+    def _handle_product_info(self, product_info: ProductInfo) -> None:
+        info_dict = product_info.info_dict
+        self.sink.write(info_dict)
+        fingerprint = self.tile_fingerprints.pop(product_info.key, None)
+        if self.snapshot_store is not None and fingerprint is not None:
+            self.snapshot_store.update(product_info.key, fingerprint, info_dict)
+        if self.is_kept_in_memory:
+            self.info_scraped.append(product_info)
+
+    def _get_browser_listener(self, driver: Driver) -> ProductInfoListener:
+        with self.browser_listeners_lock:
+            listener = self.browser_listeners.get(driver)
+            if listener is None:
+                listener = ProductInfoListener(driver, self.page_ready_timeout)
+                listener.archive = self.archive
+                self.browser_listeners[driver] = listener
+                self.driver_pool.add_retire_callback(self._forget_browser_listener)
+            listener.is_normalized = self.is_normalized_at_scrape
+            return listener
+
+    def _forget_browser_listener(self, driver: Driver) -> None:
+        with self.browser_listeners_lock:
+            self.browser_listeners.pop(driver, None)
+
+    def _scrape_product_url_in_browser(self, driver: Driver, url: str) -> ProductInfo | None:
+        # timed from here, so the wait for a pooled session and a cold browser launch never read as a slow response.
+        # a browser handed back on the verification page waits it out before that, the block was already counted
+        listener = self._get_browser_listener(driver).wait_while_blocked()
+        with self.rate_controller.request(url):
+            return listener.scrape_product_url(url)
+
+    def scrape_product_url(self, url: str) -> ProductInfo | None:
+        # one product outside of a collect_* run, for callers that bring their own urls; close() when done
+        return self._scrape_product_url(url)
+
+    def _scrape_product_url(self, url: str) -> ProductInfo | None:
+        # a CrawlBlockedError leaves the executor to retry the url after its backoff, at the pace the controller has dropped to.
+        # every request() is one real page load, the browser engine never spends a token on the http attempt it skips
+        if self.fetcher is not None:
+            with self.rate_controller.request(url):
+                product_info = self._fetch_product_info(url)
+            if product_info is not None:
+                return product_info
+        # one attempt per call, the executor is the only retry layer (with backoff) and a broken session is still replaced
+        return self.driver_pool.run(lambda driver: self._scrape_product_url_in_browser(driver, url), max_attempts= 1)
+
+    def _scrape_product_urls(self, product_urls: Iterable[str]) -> int:
+        executor = StreamingExecutor(
+            self._scrape_product_url, 
+            self.number_of_workers, 
+            timeout_n_seconds= self.task_timeout_n_seconds, 
+            max_retries= self.max_task_retries
+        )
+        number_of_products_scraped = 0
+        for task_result in executor.stream({"url": url} for url in product_urls):
+            url = task_result.kwargs["url"]
+            if not task_result.is_success:
+                print(f"Failed to scrape {url} after {task_result.number_of_attempts} attempt(s): {task_result.error}")
+                continue
+            print(f"#{task_result.index + 1} {url}")
+            product_info = task_result.result
+            if product_info is not None and self.product_index.add(product_info.key):
+                self._handle_product_info(product_info)
+                number_of_products_scraped += 1
+
+        return number_of_products_scraped
+
+    def get_wait_report(self) -> Dict[str, float]:
+        return summarize_wait_records(
+            self.listener_browser.driver.wait_records + self.address_scraper.get_wait_records() + self.driver_pool.get_wait_records()
+        )
+
+    def get_scroll_report(self) -> Dict[str, Any]:
+        # search pages scrolled in the browser, how far the adaptive scroll had to go on each
+        return summarize_scroll_stats(self.address_scraper.get_scroll_stats())
+
+    def get_incremental_report(self) -> Dict[str, int]:
+        # products listed on the search pages by why they were or were not opened, empty outside incremental mode.
+        # "unchanged" products were not opened, their rows in the output are the snapshots of their last scrape
+        return dict(self.recrawl_reasons)
+
+    def get_rate_report(self) -> Dict[str, Any]:
+        return self.rate_controller.get_report()
+
+    def get_metrics_report(self) -> Dict[str, Any] | None:
+        if self.metrics is None:
+            return
+        return self.metrics.to_dict()
+
+    def _run_sequentially(self) -> None:
+        self.listener_browser.run()
         try:
-            self.listener_browser.run()
-            all_product_urls = self.address_scraper.collect_product_urls()
+            all_product_urls = self._get_unseen_product_urls(self.address_scraper.collect_product_tiles())
             for idx, url in enumerate(all_product_urls):
                 print(f"{idx+1}/{len(all_product_urls) + 1}")
-                while self.listener_browser.is_in_login_page() or self.listener_browser.is_in_verification_page():
-                    time.sleep(1)
-                # in product page, waiting 5 secs
-                self.listener_browser.go_to_product_url(url)
-                time.sleep(5)
+                try:
+                    self.listener_browser.wait_while_blocked()
+                    with self.rate_controller.request(url), self.listener_browser.driver.stage("product"):
+                        # in product page, waiting until the product fields are rendered
+                        self.listener_browser.go_to_product_url(url)
+                        self.listener_browser.wait_until_product_page_ready()
+                        if self.listener_browser.is_blocked():
+                            raise CrawlBlockedError(self.listener_browser.driver.get_current_url())
+                except CrawlBlockedError as error:
+                    print(f"Skipped {url}: {error}")
+                    continue
+                self.listener_browser.scrape_current_page()
+        finally:
             self.listener_browser.close()
 
-            df = pd.DataFrame(
-                [info.info_dict for info in self.listener_browser.info_scraped]
-            )
-            return df
+    def _put_product_url(self, product_url_queue: Queue, url: str | None, stop_event: Event) -> bool:
+        # blocks while the queue is full, so search pages are never crawled far ahead of the workers,
+        # but gives up once the consumer side stopped and nobody will drain the queue any more
+        while not stop_event.is_set():
+            try:
+                product_url_queue.put(url, timeout= self.QUEUE_POLL_N_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce_product_urls(self, product_url_queue: Queue, stop_event: Event) -> None:
+        tile_pages = self.address_scraper.iter_product_tiles()
+        try:
+            for url in self._iter_unseen_product_urls(chain.from_iterable(tile_pages)):
+                if not self._put_product_url(product_url_queue, url, stop_event):
+                    return
+        except Exception as error:
+            print(f"[Producer] Stopped: {error}")
+        finally:
+            # closes the search browsers now instead of whenever the suspended generator is collected
+            tile_pages.close()
+            self._put_product_url(product_url_queue, None, stop_event)
+
+    def _consume_product_urls(self, product_url_queue: Queue, stop_event: Event) -> Iterator[str]:
+        while not stop_event.is_set():
+            try:
+                url = product_url_queue.get(timeout= self.QUEUE_POLL_N_SECONDS)
+            except Empty:
+                continue
+            if url is None:
+                return
+            yield url
+
+    def _run_in_parallel(self) -> None:
+        # search pages are crawled while the product workers consume the urls found so far
+        if self.fetch_engine == "browser":
+            self.driver_pool.start()
+        product_url_queue = Queue(maxsize= self.queue_size)
+        stop_event = Event()
+        producer = BackgroundThread(target= self._produce_product_urls, args= (product_url_queue, stop_event))
+        producer.start()
+        try:
+            self._scrape_product_urls(self._consume_product_urls(product_url_queue, stop_event))
+        finally:
+            # a failing consumer, a sink that cannot write say, must not leave the producer blocked on a full queue
+            stop_event.set()
+            producer.join()
+
+    def _collect(self, run: Callable[[], None], sink: ResultSink, is_kept_in_memory: bool) -> None:
+        self.sink = sink
+        self.is_kept_in_memory = is_kept_in_memory
+        self.is_normalized_at_scrape = not (is_kept_in_memory and self.is_normalized_after_scrape)
+        self.listener_browser.is_normalized = self.is_normalized_at_scrape
+        self.info_scraped = []
+        self.recrawl_reasons = {}
+        # every run starts from the seen products file, not from the keys the previous run on this crawler added
+        if self.is_product_index_owned:
+            self._set_product_index(self._load_product_index())
+        # the pool of an earlier collect_* run on this crawler was closed at its end
+        if self.is_driver_pool_owned:
+            self.driver_pool.reopen()
+        if self.metrics is not None and self.metrics_file is not None:
+            self.metrics.start_periodic_flush(self.metrics_file, self.metrics_flush_n_seconds)
+        try:
+            run()
         except Exception as error:
             print(error)
-            df = pd.DataFrame(
-                [info.info_dict for info in self.listener_browser.info_scraped]
-            )
-            return df
         finally:
-            df.to_csv(f"{random_file_name}.csv", encoding= "utf_8_sig")
\ No newline at end of file
+            self.is_normalized_at_scrape = True
+            self.close()
+            self.sink.close()
+            self._save_product_index()
+            self._save_snapshots()
+            if self.metrics is not None and self.metrics_file is not None:
+                self.metrics.stop_periodic_flush()
+
+    def close(self) -> None:
+        if self.fetcher is not None and self.is_fetcher_owned:
+            self.fetcher.close()
+        if self.is_driver_pool_owned:
+            self.driver_pool.close()
+        # a shared pool outlives this crawler, it must not keep the crawler or its listeners alive through the callback
+        self.driver_pool.remove_retire_callback(self._forget_browser_listener)
+        with self.browser_listeners_lock:
+            self.browser_listeners.clear()
+
+    def collect_info_into_df(self) -> pd.core.frame.DataFrame:
+        from product_info_normalizer import normalize_product_frame
+
+        self._collect(self._run_sequentially, CsvSink(f"{uuid.uuid4()}.csv", self.flush_size), is_kept_in_memory= True)
+        return normalize_product_frame(to_product_frame(self.info_scraped))
+
+    def collect_info_into_df_in_parallel(self) -> pd.core.frame.DataFrame:
+        from product_info_normalizer import normalize_product_frame
+
+        self._collect(self._run_in_parallel, CsvSink(f"{uuid.uuid4()}.csv", self.flush_size), is_kept_in_memory= True)
+        return normalize_product_frame(to_product_frame(self.info_scraped))
+
+    def collect_info_into_sink(self, sink: ResultSink, is_parallel: bool = True) -> int:
+        # rows only live in the sink buffer, so memory stays flat however long the crawl runs
+        self._collect(self._run_in_parallel if is_parallel else self._run_sequentially, sink, is_kept_in_memory= False)
+        return sink.number_of_rows_written
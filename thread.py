@@ -1,41 +1,244 @@
 from __future__ import annotations
 import concurrent.futures
+import heapq
 import inspect
-from typing import Callable, Dict, List, Any, Iterable
+import itertools
+import time
+from queue import Queue, Empty, Full
+from threading import Thread as BackgroundThread, Event
+from typing import Callable, Dict, List, Any, Iterator, Tuple, Type
 from collections.abc import Iterable
 
+EXECUTOR_BACKENDS = {
+    "thread": concurrent.futures.ThreadPoolExecutor,
+    "process": concurrent.futures.ProcessPoolExecutor
+}
+
+
+# marks the end of the input in the feeder queue
+_INPUT_EXHAUSTED = object()
+
+
+def _call_with_kwargs(callback: Callable, kwargs: Dict[str, Any]) -> Any:
+    # module level, so the process backend can pickle it along with the callback
+    return callback(**kwargs)
+
+
+class TaskResult:
+    def __init__(
+        self,
+        index: int,
+        kwargs: Dict[str, Any],
+        result: Any = None,
+        error: BaseException | None = None,
+        number_of_attempts: int = 1,
+        elapsed_n_seconds: float = 0.0
+    ) -> None:
+        # index is the position of kwargs in the input, results arrive in completion order
+        self.index = index
+        self.kwargs = kwargs
+        self.result = result
+        self.error = error
+        self.number_of_attempts = number_of_attempts
+        self.elapsed_n_seconds = elapsed_n_seconds
+
+    @property
+    def is_success(self) -> bool:
+        return self.error is None
+
+    def get(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def __repr__(self) -> str:
+        outcome = f"result {self.result}" if self.is_success else f"error {self.error.__class__.__name__}: {self.error}"
+        return f"Task #{self.index} {self.kwargs} -> {outcome} after {self.number_of_attempts} attempt(s)"
+
+
+class StreamingExecutor:
+    # pulls kwargs lazily and keeps at most max_workers tasks in flight, so a long input never sits in memory as futures
+    # how often a feeder blocked on a full input queue checks whether the stream was stopped
+    INPUT_POLL_N_SECONDS = 0.05
+    def __init__(
+        self,
+        callback: Callable,
+        max_workers: int = 5,
+        backend: str = "thread",
+        timeout_n_seconds: float | None = None,
+        max_retries: int = 0,
+        backoff_n_seconds: float = 1.0,
+        backoff_factor: float = 2.0,
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,)
+    ) -> None:
+        assert backend in EXECUTOR_BACKENDS, f"{backend} is not one of {list(EXECUTOR_BACKENDS)}"
+        self.callback = callback
+        self.max_workers = max(1, max_workers)
+        self.backend = backend
+        self.timeout_n_seconds = timeout_n_seconds
+        self.max_retries = max_retries
+        self.backoff_n_seconds = backoff_n_seconds
+        self.backoff_factor = backoff_factor
+        self.retry_on = retry_on
+
+    def _get_backoff_n_seconds(self, attempt: int) -> float:
+        return self.backoff_n_seconds * self.backoff_factor ** (attempt - 1)
+
+    def _is_retried(self, error: BaseException, attempt: int) -> bool:
+        return attempt <= self.max_retries and isinstance(error, self.retry_on)
+
+    def _feed_input(self, kwargs: Iterable[Dict[str, Any]], input_queue: Queue, input_signals: List[concurrent.futures.Future], stop_event: Event) -> None:
+        # an input that blocks, like a generator over a queue of urls still being crawled, blocks this thread only.
+        # the queue holds one item per worker, so the input is never read more than max_workers items ahead
+        def put(item: Any) -> bool:
+            while not stop_event.is_set():
+                try:
+                    input_queue.put(item, timeout= self.INPUT_POLL_N_SECONDS)
+                except Full:
+                    continue
+                # wakes stream() if it is waiting on its workers for lack of input
+                try:
+                    input_signals[0].set_result(None)
+                except concurrent.futures.InvalidStateError:
+                    pass
+                return True
+            return False
+
+        try:
+            for index_and_kwargs in enumerate(kwargs):
+                if not put(index_and_kwargs):
+                    return
+        except BaseException as error:
+            put(error)
+            return
+        put(_INPUT_EXHAUSTED)
+
+    def stream(self, kwargs: Iterable[Dict[str, Any]]) -> Iterator[TaskResult]:
+        assert isinstance(kwargs, Iterable), f"{kwargs} is not iterable type"
+        input_queue = Queue(maxsize= self.max_workers)
+        # the current input signal, a future the feeder resolves on every item so it can be waited on with the tasks
+        input_signals = [concurrent.futures.Future()]
+        stop_event = Event()
+        BackgroundThread(target= self._feed_input, args= (kwargs, input_queue, input_signals, stop_event), daemon= True).start()
+        is_exhausted = False
+        # future -> (index, kwargs, attempt, submitted at)
+        running: Dict[concurrent.futures.Future, Tuple[int, Dict[str, Any], int, float]] = {}
+        # timed out tasks cannot be killed, they keep their worker busy until they return and so still count as in flight
+        abandoned = set()
+        # (due at, tie breaker, index, kwargs, attempt)
+        retries: List[Tuple[float, int, int, Dict[str, Any], int]] = []
+        retry_sequence = itertools.count()
+
+        def handle_failure(index: int, task_kwargs: Dict[str, Any], attempt: int, error: BaseException, elapsed_n_seconds: float) -> TaskResult | None:
+            if not self._is_retried(error, attempt):
+                return TaskResult(index, task_kwargs, error= error, number_of_attempts= attempt, elapsed_n_seconds= elapsed_n_seconds)
+            backoff_n_seconds = self._get_backoff_n_seconds(attempt)
+            print(f"Task #{index} failed ({error.__class__.__name__}), retrying {attempt}/{self.max_retries} in {backoff_n_seconds:.1f}s")
+            heapq.heappush(retries, (time.monotonic() + backoff_n_seconds, next(retry_sequence), index, task_kwargs, attempt + 1))
+
+        executor = EXECUTOR_BACKENDS[self.backend](max_workers= self.max_workers)
+        try:
+            while (True):
+                abandoned = {future for future in abandoned if not future.done()}
+                # due retries go first, new input is only pulled when a worker is free
+                is_waiting_for_input = False
+                while len(running) + len(abandoned) < self.max_workers:
+                    if len(retries) > 0 and retries[0][0] <= time.monotonic():
+                        _, _, index, task_kwargs, attempt = heapq.heappop(retries)
+                    elif not is_exhausted:
+                        try:
+                            item = input_queue.get_nowait()
+                        except Empty:
+                            if input_signals[0].done():
+                                # the signal of an item already taken, a fresh one is armed and the queue checked again
+                                input_signals[0] = concurrent.futures.Future()
+                                continue
+                            # no input yet is not the end of it, the loop below keeps serving the running tasks
+                            is_waiting_for_input = True
+                            break
+                        if item is _INPUT_EXHAUSTED:
+                            is_exhausted = True
+                            continue
+                        if isinstance(item, BaseException):
+                            raise item
+                        index, task_kwargs = item
+                        attempt = 1
+                    else:
+                        break
+                    future = executor.submit(_call_with_kwargs, self.callback, task_kwargs)
+                    running[future] = (index, task_kwargs, attempt, time.monotonic())
+
+                if is_exhausted and len(running) == 0 and len(retries) == 0:
+                    return
+
+                # sleep until a task finishes, the next task times out or the next retry is due
+                deadlines = [retries[0][0]] if len(retries) > 0 else []
+                if self.timeout_n_seconds is not None:
+                    deadlines.extend(submitted_at + self.timeout_n_seconds for _, _, _, submitted_at in running.values())
+                wait_n_seconds = max(0.0, min(deadlines) - time.monotonic()) if len(deadlines) > 0 else None
+                waited_futures = list(running) + list(abandoned) + ([input_signals[0]] if is_waiting_for_input else [])
+                if len(waited_futures) == 0:
+                    time.sleep(wait_n_seconds)
+                    continue
+                done, _ = concurrent.futures.wait(waited_futures, timeout= wait_n_seconds, return_when= concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    if future not in running:
+                        continue
+                    index, task_kwargs, attempt, submitted_at = running.pop(future)
+                    elapsed_n_seconds = time.monotonic() - submitted_at
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        task_result = handle_failure(index, task_kwargs, attempt, error, elapsed_n_seconds)
+                        if task_result is not None:
+                            yield task_result
+                        continue
+                    yield TaskResult(index, task_kwargs, result, number_of_attempts= attempt, elapsed_n_seconds= elapsed_n_seconds)
+
+                if self.timeout_n_seconds is None:
+                    continue
+                now = time.monotonic()
+                for future, (index, task_kwargs, attempt, submitted_at) in list(running.items()):
+                    if now - submitted_at < self.timeout_n_seconds:
+                        continue
+                    running.pop(future)
+                    if not future.cancel():
+                        abandoned.add(future)
+                    error = TimeoutError(f"Task timed out after {self.timeout_n_seconds}s")
+                    task_result = handle_failure(index, task_kwargs, attempt, error, now - submitted_at)
+                    if task_result is not None:
+                        yield task_result
+        finally:
+            # also reached when the consumer stops early, queued work is dropped instead of run to completion
+            stop_event.set()
+            executor.shutdown(wait= False, cancel_futures= True)
+
 
 class Thread:
+    # the original list-returning api, now a thin layer over StreamingExecutor
     def __init__(self, callback:Callable, kwargs:Iterable[Dict[Any, Any]], max_workers: int = 5) -> None:
         assert isinstance(kwargs, Iterable), f"{kwargs} is not iterable type"
-        
+
         self.callback = callback
         self.kwargs = kwargs
         self.max_workers = max_workers
-    
-    def _create_callback(self, **kwargs) -> Callable:
-        return lambda : self.callback(**kwargs)
-    
-    def _generate_callbacks(self) -> List[Callable]:
-        return [self._create_callback(**kwargs) for kwargs in self.kwargs]
-    
+
+    def stream(self) -> Iterator[TaskResult]:
+        return StreamingExecutor(self.callback, self.max_workers).stream(self.kwargs)
+
     def execute(self) -> List[Any]:
-        callbacks = self._generate_callbacks()
-        with concurrent.futures.ThreadPoolExecutor(max_workers= self.max_workers) as exe:
-            futures = [ exe.submit(callback) for callback in callbacks ]
-            
-            return [future.result() for future in concurrent.futures.as_completed(futures)]
-    
+        # results in completion order, the first failure is raised
+        return [task_result.get() for task_result in self.stream()]
+
     def map(self) -> List[Any]:
-        callbacks = self._generate_callbacks()
-        with concurrent.futures.ThreadPoolExecutor() as exe:
-            futures = [ exe.submit(callback) for callback in callbacks ]
-            
-            return [future.result() for future in futures]
-    
-                
+        # results in input order
+        task_results = sorted(self.stream(), key= lambda task_result: task_result.index)
+        return [task_result.get() for task_result in task_results]
+
+
     def __repr__(self) -> str:
         return "\n".join([
             f"Callback:\n{inspect.getsource(self.callback)}",
             f"Arguments To Be Subbmitted: {self.kwargs}"
-        ])
\ No newline at end of file
+        ])
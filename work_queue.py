@@ -0,0 +1,206 @@
+from __future__ import annotations
+from typing import List, Dict, Iterable, Iterator, Tuple, Any
+from threading import local
+import json
+import sqlite3
+import time
+
+# a durable work queue in one sqlite file, the local reference backend for coordinator/worker crawls.
+# workers lease tasks and acknowledge them with their result, a lease that runs out puts the task back up for grabs.
+# by default the file is for the processes of one machine, in WAL mode, whose shared memory index does not work over a
+# network filesystem. is_shared_across_hosts switches to the rollback journal, so processes on other machines can share
+# the file over a filesystem with working posix locks, at the price of readers and the writer blocking each other.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    number_of_attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (queue, key)
+);
+CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (queue, status, id);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    row TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+
+TASK_STATUSES = ("pending", "leased", "done", "failed")
+
+
+class Task:
+    def __init__(self, task_id: int, queue: str, key: str, payload: Dict[str, Any], number_of_attempts: int) -> None:
+        self.task_id = task_id
+        self.queue = queue
+        self.key = key
+        self.payload = payload
+        self.number_of_attempts = number_of_attempts
+
+    def __repr__(self) -> str:
+        return f"Task #{self.task_id} in {self.queue}: {self.key}, attempt {self.number_of_attempts}"
+
+
+class SqliteWorkQueue:
+    def __init__(
+        self,
+        file_name: str,
+        lease_n_seconds: float = 300,
+        max_attempts: int = 3,
+        busy_timeout_n_seconds: float = 30,
+        is_shared_across_hosts: bool = False
+    ) -> None:
+        self.file_name = file_name
+        self.is_shared_across_hosts = is_shared_across_hosts
+        self.lease_n_seconds = lease_n_seconds
+        self.max_attempts = max_attempts
+        self.busy_timeout_n_seconds = busy_timeout_n_seconds
+        # sqlite connections must stay on the thread that opened them
+        self.connections = local()
+        self._get_connection().executescript(SCHEMA)
+
+    def _get_connection(self) -> sqlite3.Connection:
+        connection = getattr(self.connections, "connection", None)
+        if connection is None:
+            # autocommit, every write below opens its own BEGIN IMMEDIATE so concurrent claims serialize on the file lock
+            connection = sqlite3.connect(self.file_name, timeout= self.busy_timeout_n_seconds, isolation_level= None)
+            if self.is_shared_across_hosts:
+                connection.execute("PRAGMA journal_mode=DELETE")
+                connection.execute("PRAGMA synchronous=FULL")
+            else:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            self.connections.connection = connection
+        return connection
+
+    def _write(self, statements: List[Tuple[str, tuple]]) -> List[sqlite3.Cursor]:
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursors = [connection.execute(statement, parameters) for statement, parameters in statements]
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return cursors
+
+    def put(self, queue: str, keys_and_payloads: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        # a key already in the queue is ignored whatever its status, so re-queuing the same product is free
+        now = time.time()
+        cursors = self._write([
+            ("INSERT OR IGNORE INTO tasks (queue, key, payload, updated_at) VALUES (?, ?, ?, ?)", (queue, key, json.dumps(payload, ensure_ascii= False), now))
+            for key, payload in keys_and_payloads
+        ])
+        return sum(cursor.rowcount for cursor in cursors)
+
+    def claim(self, queue: str, worker_id: str, batch_size: int = 1) -> List[Task]:
+        now = time.time()
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # a lease that ran out after the last attempt is not handed out again
+            connection.execute(
+                "UPDATE tasks SET status = 'failed', last_error = 'lease expired', updated_at = ? "
+                "WHERE queue = ? AND status = 'leased' AND lease_expires_at < ? AND number_of_attempts >= ?",
+                (now, queue, now, self.max_attempts)
+            )
+            rows = connection.execute(
+                "SELECT id, key, payload, number_of_attempts FROM tasks "
+                "WHERE queue = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires_at < ?)) "
+                "ORDER BY id LIMIT ?",
+                (queue, now, batch_size)
+            ).fetchall()
+            for task_id, _, _, _ in rows:
+                connection.execute(
+                    "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires_at = ?, "
+                    "number_of_attempts = number_of_attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + self.lease_n_seconds, now, task_id)
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [Task(task_id, queue, key, json.loads(payload), number_of_attempts + 1) for task_id, key, payload, number_of_attempts in rows]
+
+    def extend_lease(self, task: Task, worker_id: str) -> bool:
+        # False when the lease was lost, another worker may already be on the task
+        now = time.time()
+        cursor, = self._write([(
+            "UPDATE tasks SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + self.lease_n_seconds, now, task.task_id, worker_id)
+        )])
+        return cursor.rowcount == 1
+
+    def ack(self, task: Task, worker_id: str, result_key: str | None = None, result_row: Dict[str, Any] | None = None) -> bool:
+        # the result and the acknowledgement commit together, so a crash never leaves one without the other.
+        # an ack after the lease was taken over is dropped, the new owner will report the task.
+        now = time.time()
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now, task.task_id, worker_id)
+            )
+            is_acked = cursor.rowcount == 1
+            if is_acked and result_row is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results (key, row, worker_id, finished_at) VALUES (?, ?, ?, ?)",
+                    (result_key or task.key, json.dumps(result_row, ensure_ascii= False, default= str), worker_id, now)
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return is_acked
+
+    def nack(self, task: Task, worker_id: str, error: str) -> None:
+        # back to pending for another attempt, or failed once the attempts are used up
+        now = time.time()
+        self._write([(
+            "UPDATE tasks SET status = CASE WHEN number_of_attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_owner = NULL, lease_expires_at = NULL, last_error = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (self.max_attempts, error, now, task.task_id, worker_id)
+        )])
+
+    def get_counts(self, queue: str | None = None) -> Dict[str, Dict[str, int]]:
+        counts: Dict[str, Dict[str, int]] = {}
+        rows = self._get_connection().execute(
+            "SELECT queue, status, COUNT(*) FROM tasks WHERE ? IS NULL OR queue = ? GROUP BY queue, status", (queue, queue)
+        ).fetchall()
+        for queue_name, status, number_of_tasks in rows:
+            counts.setdefault(queue_name, dict.fromkeys(TASK_STATUSES, 0))[status] = number_of_tasks
+        return counts
+
+    def is_drained(self) -> bool:
+        # nothing pending and nothing leased, an expired lease still counts since it will be claimed again
+        number_of_open_tasks, = self._get_connection().execute(
+            "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')"
+        ).fetchone()
+        return number_of_open_tasks == 0
+
+    def iter_results(self) -> Iterator[Dict[str, Any]]:
+        for row, in self._get_connection().execute("SELECT row FROM results ORDER BY finished_at"):
+            yield json.loads(row)
+
+    def get_number_of_results(self) -> int:
+        number_of_results, = self._get_connection().execute("SELECT COUNT(*) FROM results").fetchone()
+        return number_of_results
+
+    def close(self) -> None:
+        connection = getattr(self.connections, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.connections.connection = None
+
+    def __repr__(self) -> str:
+        return f"SqliteWorkQueue at {self.file_name}: {self.get_counts()}"